@@ -0,0 +1,69 @@
+#!/usr/bin/python3
+
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import sugar
+from frame_formats import get_frame
+
+def get_sequence(dir_, frames, height, width, flicker=.08):
+
+    import numpy
+
+    rng = numpy.random.default_rng(0)
+    img = get_frame(height, width).astype(numpy.float32)
+    ramp = numpy.linspace(.6, 1., frames)
+    gains = ramp * (1 + rng.uniform(-flicker, flicker, frames))
+    paths = []
+    for i, gain in enumerate(gains):
+        path = os.path.join(dir_, '%05d.png' % i)
+        sugar.write_frame(path, numpy.clip(img * gain, 0, 255)
+                                     .astype(numpy.uint8))
+        paths.append(path)
+    return paths
+
+def get_flicker(paths):
+
+    import numpy
+
+    lum = numpy.array([value for idx, i, value in
+                       sugar._deflicker__luminance(
+                       [(0, i, path) for i, path in enumerate(paths)])])
+    return numpy.std(sugar.deflicker_gains(lum) - 1)
+
+def main(frames=10000, height=90, width=160):
+    timelapse_deflicker_pl = sys.argv[1] if len(sys.argv) > 1 else None
+    with tempfile.TemporaryDirectory() as temp_dir:
+        from_dir = os.path.join(temp_dir, 'enhanced')
+        to_dir = os.path.join(temp_dir, 'deflickered')
+        os.mkdir(from_dir)
+        os.mkdir(to_dir)
+        from_files = get_sequence(from_dir, frames, height, width)
+        to_files = [os.path.join(to_dir, os.path.basename(path))
+                    for path in from_files]
+        start = time.perf_counter()
+        sugar.deflicker_frames([(from_files, to_files, set())])
+        elapsed = time.perf_counter() - start
+        print(f'{"engine":8} {"seconds":>8} {"fps":>8} {"flicker":>8}')
+        print(f'{"input":8} {"":>8} {"":>8} {get_flicker(from_files):8.4f}')
+        print(f'{"builtin":8} {elapsed:8.1f} {frames / elapsed:8.1f} '
+              f'{get_flicker(to_files):8.4f}')
+        if timelapse_deflicker_pl is not None:
+            start = time.perf_counter()
+            subprocess.run(['/usr/bin/perl',
+                            os.path.abspath(timelapse_deflicker_pl)],
+                           cwd=from_dir, stdout=subprocess.DEVNULL,
+                           stderr=subprocess.DEVNULL, check=True)
+            elapsed = time.perf_counter() - start
+            deflickered = [os.path.join(from_dir, 'Deflickered',
+                           os.path.basename(path)) for path in from_files]
+            print(f'{"perl":8} {elapsed:8.1f} {frames / elapsed:8.1f} '
+                  f'{get_flicker(deflickered):8.4f}')
+
+if '__main__' == __name__:
+    main()
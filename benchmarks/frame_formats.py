@@ -0,0 +1,53 @@
+#!/usr/bin/python3
+
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import sugar
+
+FORMATS = [
+    ('png level 0', '.png', 0),
+    ('png level 1', '.png', 1),
+    ('png level 3', '.png', 3),
+    ('tiff', '.tif', None),
+    ('npy', '.npy', None),
+]
+
+def get_frame(height=2160, width=3840):
+
+    import numpy
+
+    y, x = numpy.mgrid[0:height, 0:width].astype(numpy.float32)
+    rng = numpy.random.default_rng(0)
+    img = numpy.stack([x / width, y / height, (x + y) / (width + height)],
+                      axis=-1) * 220
+    img += rng.normal(0, 4, img.shape)
+    return numpy.clip(img, 0, 255).astype(numpy.uint8)
+
+def main(frames=10):
+    img = get_frame()
+    print(f'{"format":12} {"encode fps":>10} {"decode fps":>10} '
+          f'{"MiB/frame":>10}')
+    with tempfile.TemporaryDirectory() as temp_dir:
+        for name, ext, level in FORMATS:
+            paths = [os.path.join(temp_dir, '%05d%s' % (i, ext))
+                     for i in range(frames)]
+            start = time.perf_counter()
+            for path in paths:
+                sugar.write_frame(path, img, level)
+            encode = frames / (time.perf_counter() - start)
+            start = time.perf_counter()
+            for path in paths:
+                sugar.read_frame(path).sum()
+            decode = frames / (time.perf_counter() - start)
+            size = os.path.getsize(paths[0]) / (1 << 20)
+            print(f'{name:12} {encode:10.1f} {decode:10.1f} {size:10.1f}')
+            for path in paths:
+                os.remove(path)
+
+if '__main__' == __name__:
+    main()
@@ -0,0 +1,57 @@
+#!/usr/bin/python3
+
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import sugar
+from frame_formats import get_frame
+
+LAYOUTS = [
+    ('png files', '.png'),
+    ('npy files', '.npy'),
+    ('frame store', ''),
+]
+
+def count_inodes(dir_):
+    inodes = 1
+    for root, dirs, files in os.walk(dir_):
+        inodes += len(dirs) + len(files)
+    return inodes
+
+def main(frames=200, height=720, width=1280):
+    img = get_frame(height, width)
+    names = ['%05d' % i for i in range(frames)]
+    print(f'{"layout":12} {"write fps":>10} {"read fps":>10} '
+          f'{"cleanup s":>10} {"inodes":>8}')
+    with tempfile.TemporaryDirectory() as temp_dir:
+        for name, ext in LAYOUTS:
+            dir_ = os.path.join(temp_dir, name.replace(' ', '_'))
+            os.mkdir(dir_)
+            paths = [os.path.join(dir_, root + ext) for root in names]
+            start = time.perf_counter()
+            if not ext:
+                sugar.FrameStore.create(
+                      os.path.join(dir_, sugar.FRAME_STORE_FILE),
+                      names, img.shape, img.dtype)
+            for path in paths:
+                sugar.write_frame(path, img)
+            write = frames / (time.perf_counter() - start)
+            start = time.perf_counter()
+            for path in paths:
+                sugar.read_frame(path).sum()
+            read = frames / (time.perf_counter() - start)
+            inodes = count_inodes(dir_)
+            os.sync()
+            start = time.perf_counter()
+            shutil.rmtree(dir_)
+            cleanup = time.perf_counter() - start
+            print(f'{name:12} {write:10.1f} {read:10.1f} '
+                  f'{cleanup:10.3f} {inodes:8}')
+
+if '__main__' == __name__:
+    main()
@@ -0,0 +1,61 @@
+#!/usr/bin/python3
+
+import filecmp
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import sugar
+
+RIFE_STUB = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                         'rife_stub.py')
+CONFIGS = [(1, 0), (2, 0), (4, 0), (4, 300)]
+
+def get_input_dir(input_dir, videos):
+
+    import cv2
+    import numpy
+
+    os.mkdir(input_dir)
+    for idx, frames in enumerate(videos):
+        open(os.path.join(input_dir, 'v%d.mp4' % idx), 'w').close()
+        dst_dir = os.path.join(input_dir, 'v%d' % idx)
+        from_working_dir = os.path.join(dst_dir, sugar.WORKING_DIRS[4-1])
+        os.makedirs(from_working_dir)
+        open(os.path.join(dst_dir, sugar.DONE_FILES[4-1]), 'w').close()
+        for i in range(frames):
+            img = numpy.full((9, 16, 3), i % 256, dtype=numpy.uint8)
+            img[0, 0, 0] = i // 256
+            cv2.imwrite(os.path.join(from_working_dir,
+                                     '%05d.png' % i), img)
+    return input_dir
+
+def main(videos=(1200, 150, 150, 150)):
+    results = []
+    with tempfile.TemporaryDirectory() as temp_dir:
+        reference = None
+        for instances, segment in CONFIGS:
+            input_dir = get_input_dir(os.path.join(
+                        temp_dir, f'{instances}_{segment}'), videos)
+            start = time.perf_counter()
+            sugar.interpolate(input_dir, RIFE_STUB,
+                              instances=instances, segment=segment)
+            elapsed = time.perf_counter() - start
+            output = os.path.join(input_dir, 'v0', sugar.WORKING_DIRS[5-1])
+            names = sorted(os.listdir(output))
+            if reference is None:
+                reference = output
+            match, mismatch, errors = filecmp.cmpfiles(
+                                      reference, output, names, shallow=False)
+            identical = names == sorted(os.listdir(reference)) \
+                        and not mismatch and not errors
+            results.append((instances, segment, elapsed, identical))
+    print(f'{"instances":>9} {"segment":>8} {"seconds":>8} {"identical":>9}')
+    for instances, segment, elapsed, identical in results:
+        print(f'{instances:9} {segment:8} {elapsed:8.1f} {str(identical):>9}')
+
+if '__main__' == __name__:
+    main()
@@ -0,0 +1,57 @@
+#!/usr/bin/python3
+
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import sugar
+from frame_formats import get_frame
+
+CONFIGS = [(1, False), (2, False), (4, False), (4, True)]
+
+def get_input_dir(input_dir, videos, height, width):
+    img = get_frame(height, width)
+    os.mkdir(input_dir)
+    for idx, frames in enumerate(videos):
+        src = os.path.join(input_dir, 'v%d.mp4' % idx)
+        subprocess.run(['/usr/bin/ffmpeg', '-nostdin', '-v', 'error',
+                        '-f', 'lavfi', '-i', 'testsrc=size=320x180:rate=30',
+                        '-f', 'lavfi', '-i', 'sine', '-t', '1',
+                        '-c:v', 'libx264', '-c:a', 'aac', src], check=True)
+        dst_dir = os.path.join(input_dir, 'v%d' % idx)
+        from_working_dir = os.path.join(dst_dir, sugar.WORKING_DIRS[5-1])
+        os.makedirs(from_working_dir)
+        open(os.path.join(dst_dir, sugar.DONE_FILES[5-1]), 'w').close()
+        for i in range(frames):
+            sugar.write_frame(os.path.join(from_working_dir,
+                                           '%08d.png' % (i + 1)), img)
+    return input_dir
+
+def main(videos=(480, 240, 240, 240), height=720, width=1280):
+    results = []
+    with tempfile.TemporaryDirectory() as temp_dir:
+        template = get_input_dir(os.path.join(temp_dir, 'template'),
+                                 videos, height, width)
+        for encodes, pipe in CONFIGS:
+            input_dir = os.path.join(temp_dir, f'{encodes}_{pipe}')
+            shutil.copytree(template, input_dir, copy_function=os.link)
+            start = time.perf_counter()
+            sugar.merge(input_dir, encodes=encodes, pipe=pipe)
+            elapsed = time.perf_counter() - start
+            done = sum(os.path.exists(os.path.join(
+                       input_dir, 'v%d-sugar.mp4' % idx))
+                       for idx in range(len(videos)))
+            results.append((encodes, pipe, elapsed, done))
+    print(f'{"encodes":>7} {"pipe":>5} {"seconds":>8} {"speedup":>8} '
+          f'{"videos":>6}')
+    for encodes, pipe, elapsed, done in results:
+        print(f'{encodes:7} {str(pipe):>5} {elapsed:8.1f} '
+              f'{results[0][2] / elapsed:8.2f} {done:6}')
+
+if '__main__' == __name__:
+    main()
@@ -0,0 +1,23 @@
+#!/usr/bin/python3
+
+import os
+import shutil
+import sys
+import time
+
+def main():
+    opts = dict(zip(sys.argv[1::2], sys.argv[2::2]))
+    input_dir = opts['-i']
+    output_dir = opts['-o']
+    seconds = float(os.environ.get('RIFE_STUB_SECONDS', '.004'))
+    names = sorted(name for name in os.listdir(input_dir)
+                   if os.path.splitext(name)[1].lower()
+                   in ['.png', '.jpg', '.jpeg'])
+    os.makedirs(output_dir, exist_ok=True)
+    for i in range(len(names) * 2):
+        time.sleep(seconds)
+        shutil.copyfile(os.path.join(input_dir, names[i // 2]),
+                        os.path.join(output_dir, '%08d.png' % (i + 1)))
+
+if '__main__' == __name__:
+    main()
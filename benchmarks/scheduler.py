@@ -0,0 +1,76 @@
+#!/usr/bin/python3
+
+import collections
+import multiprocessing
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import sugar
+
+def static_que(buf, channels, min_, max_):
+    que = []
+    prev = max_ + 1
+    while buf:
+        chunk = min(max(int(len(buf) / channels), min_), max_)
+        if chunk == prev:
+            while buf:
+                items = []
+                for i in range(chunk):
+                    items.append(buf.popleft())
+                    if not buf:
+                        break
+                if items:
+                    que.append(items)
+            return que
+        while len(buf) >= chunk * channels:
+            for i in range(channels):
+                items = []
+                for j in range(chunk):
+                    items.append(buf.popleft())
+                que.append(items)
+        prev = chunk
+    return que
+
+def work(frames):
+    start = time.time()
+    for cost in frames:
+        time.sleep(cost)
+    return os.getpid(), start, time.time()
+
+def get_frames():
+    frames = []
+    for video in range(8):
+        cost = .004 if video < 7 else .016
+        frames.extend([cost] * 200)
+    return frames
+
+def tail_idle(spans, started):
+    ends = collections.defaultdict(float)
+    for pid, start, end in spans:
+        ends[pid] = max(ends[pid], end)
+    makespan = max(ends.values())
+    idle = sum(makespan - end for end in ends.values())
+    return makespan - started, idle
+
+def main():
+    channels = 4
+    sugar.scheduler__chunk_seconds = .2
+    with multiprocessing.Pool(channels) as pool:
+        pool.map(time.sleep, [.1] * channels)
+        started = time.time()
+        que = static_que(collections.deque(get_frames()), channels, 5, 500)
+        spans = pool.map(work, que, chunksize=1)
+        wall, idle = tail_idle(spans, started)
+        print(f'static get_que   wall {wall:6.2f}s  tail idle {idle:6.2f}s')
+        started = time.time()
+        scheduler = sugar.FrameScheduler(get_frames(), channels, 5, 500,
+                                         weight=lambda cost: cost)
+        spans = [span for pid, frames, span in scheduler.run(pool, work)]
+        wall, idle = tail_idle(spans, started)
+        print(f'FrameScheduler   wall {wall:6.2f}s  tail idle {idle:6.2f}s')
+
+if '__main__' == __name__:
+    main()
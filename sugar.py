@@ -2,6 +2,8 @@
 
 import collections
 import errno
+import json
+import math
 import os
 import psutil
 import re
@@ -10,6 +12,7 @@ import rich.markdown
 import rich.progress
 import rich.prompt
 import rich.table
+import rich.text
 import shutil
 import sys
 import subprocess
@@ -18,6 +21,41 @@ import time
 
 rife_ncnn_vulkan__arg_g = '-1,-1,-1,-1,0'
 rife_ncnn_vulkan__arg_j = '3:2,2,2,2,1:5'
+rife_ncnn_vulkan__instances = 1
+interpolate__flow_scale = .5
+lut__interpolation = 'tetrahedral'
+lut__strip_pixels = 1 << 15
+lut_bake__min_size = 33
+lut_bake__tolerance = 1.
+lut_cache__max_size = 8
+grade__io_threads = 2
+grade__queue_depth = 4
+memory__budget = .75
+stream__ring_frames = 8
+deflicker__window = 15
+deflicker__stats_stride = 4
+memory__worker_overhead = 128 << 20
+scheduler__chunk_seconds = 2.
+scheduler__depth = 2
+progress__idle_seconds = 30.
+directory_stats__threads = 8
+directory_stats__settle_seconds = 2.
+resume__threads = 16
+probe__threads = 8
+frame_cache__max_bytes = 64 << 30
+frame__png_compression = 1
+supervisor__stderr_lines = 20
+supervisor__stderr_bytes = 1 << 16
+audio__threads = 8
+encode__threads_per_job = 16
+encode__keyint = 250
+pipe__prefetch_frames = 16
+pipe__threads = 4
+supervisor__seconds_per_frame = {
+    'timelapse-deflicker': .2,
+    'rife-ncnn-vulkan': .1,
+    'libx265': .2,
+}
 
 def stabilize(input_, gyroflow_path):
     gyroflow = os.path.abspath(gyroflow_path)
@@ -53,8 +91,7 @@ Did all the gyroflow jobs be successfully completed?'''):
         for task in tasks:
             if os.path.isdir(task.to_working_dir) \
             and get_directory_contents([task.to_working_dir]) > 0:
-                with open(task.to_done_file, 'w'):
-                    pass
+                mark_done(task)
         summary(input_dir, 1)
         markdown('''\
 Now you can re-execute this program with the "-2" parameter \
@@ -65,142 +102,801 @@ to perform the next step "Color Gradation".''')
 Since this operation is not fully completed, \
 consider re-performing this procedure.''')
 
-def color_grade(input_, lut_files):
+def color_grade(input_, lut_files, resume=False, frame_cache=None,
+                frame_format='png', png_compression=1, stream=False,
+                deflicker=False):
 
-    import ApplyLUT
     import cv2
-    import ffprobe
     import multiprocessing
     import numpy
 
     markdown('''## Color Gradation''')
+    frame_ext = FRAME_FORMATS[frame_format]
+    if deflicker and stream:
+        log.warning('streamed videos cannot be deflickered '
+                    'while grading, deflickering is disabled')
+        deflicker = False
+    if deflicker and frame_cache is not None:
+        log.warning('deflickered frames cannot be cached, '
+                    'the frame cache is disabled')
+        frame_cache = None
     input_dir = os.path.abspath(input_)
-    tasks = get_effective_dirs(input_dir, 2)
+    tasks = get_effective_dirs(input_dir, 2, from_source=stream)
     regex_digital = re.compile(r'[0-9]{3,}')
     buf = collections.deque()
+    series = []
+    streams = []
     active_tasks = []
-    working_dirs = []
     preset_map = {}
-    preset_ptr = 0
-    for idx, task in rich.progress.track(enumerate(tasks, start=1),
-                   total=len(tasks), description='Collecting ...'):
-        metadata = ffprobe.FFProbe(task.src)
+    preset_idxs = {}
+    for lut_file in lut_files:
+        if not os.path.isfile(lut_file):
+            raise FileNotFoundError(
+                  errno.ENOENT, f'file "{lut_file}" not found')
+    baked_dir_holder = temprary_directory_holder(suffix='_LUT')
+    baked_dir = next(baked_dir_holder)
+    probe_cache = get_probe_cache(input_dir)
+    probes = probe_cache.map([task.src for task in tasks])
+    for idx, (task, metadata) in rich.progress.track(
+        enumerate(zip(tasks, probes), start=1),
+        total=len(tasks), description='Collecting ...'
+    ):
         video0 = metadata.video[0]
         if video0.color_transfer.strip().endswith('2020'):
             log.warning(f'"{task.src}" is HLG video, ignored')
-            with open(task.to_done_file, 'w'):
-                pass
+            mark_done(task)
             continue
+        source = _color_grade__source(task) if stream else None
         if 'pc' == video0.color_range.strip() \
            and not video0.color_transfer.strip().endswith('709'):
-            preset_idx = preset_ptr
-            preset_map[preset_ptr] = lut_files
-            preset_ptr += 1
-        elif not lut_files or len(lut_files) < 2:
-            with open(task.to_done_file, 'w'):
-                pass
+            chain = tuple(lut_files)
+        elif (not lut_files or len(lut_files) < 2) and not source:
+            mark_done(task)
             continue
         else:
-            preset_idx = preset_ptr
-            preset_map[preset_ptr] = lut_files[1:]
-            preset_ptr += 1
+            chain = tuple(lut_files[1:])
+        if chain not in preset_idxs:
+            preset_idx = len(preset_idxs)
+            preset_idxs[chain] = preset_idx
+            if len(chain) > 1:
+                baked_file = os.path.join(
+                             baked_dir, '%05d.cube' % preset_idx)
+                bake_luts(chain, baked_file)
+                preset_map[preset_idx] = [baked_file]
+            else:
+                preset_map[preset_idx] = list(chain)
+        preset_idx = preset_idxs[chain]
+        if deflicker:
+            task = task._replace(
+                   to_working_dir=os.path.join(task.dst_dir,
+                                               WORKING_DIRS[4-1]),
+                   to_done_file=os.path.join(task.dst_dir,
+                                             DONE_FILES[4-1]))
         frames = {}
-        for from_name in os.listdir(task.from_working_dir):
+        for from_name in [] if source else list_frames(
+                                           task.from_working_dir):
             root, ext = os.path.splitext(from_name)
-            ext = ext.lower()
-            if ext not in ['.png', '.jpg', '.jpeg']:
-                continue
             match = regex_digital.search(root)
             if match is None:
                 continue
-            to_name = root[match.start():match.end()] + ext
+            to_name = root[match.start():match.end()] + frame_ext
             to_file = os.path.join(task.to_working_dir, to_name)
             from_file = os.path.join(task.from_working_dir, from_name)
             if to_file in frames:
                 log.warning(f'duplicate frames "{to_name}"')
             else:
                 frames[to_file] = (from_file, preset_idx)
-        if not frames:
+        if not frames and not source:
             log.warning('nothing to do with '
                         f'"{task.to_working_dir}", ignored')
             continue
+        luts_file = os.path.join(task.dst_dir, 'color_gradation_luts')
+        luts = [[os.path.realpath(lut_file),
+                 os.stat(lut_file).st_mtime_ns] for lut_file in chain]
+        luts.append(os.path.realpath(source) if source else frame_ext)
+        if deflicker:
+            luts.append(['deflicker', deflicker__window])
+            sequence = [(to_file, from_file, preset_idx) for to_file,
+                        (from_file, preset_idx) in sorted(frames.items())]
+        keep = False
         if os.path.exists(task.to_working_dir):
             if not os.path.isdir(task.to_working_dir):
                 log.warning(f'"{task.to_working_dir}" '
                             'exists but is not a directory')
                 continue
-            shutil.rmtree(task.to_working_dir)
-            log.warning(f'directory "{task.to_working_dir}" '
-                        'has been reset')
-        clean_other_files(task.from_working_dir)
-        os.mkdir(task.to_working_dir)
+            keep = resume and _color_grade__luts(luts_file) == luts
+            if not keep:
+                shutil.rmtree(task.to_working_dir)
+                log.warning(f'directory "{task.to_working_dir}" '
+                            'has been reset')
+        if not source:
+            clean_other_files(task.from_working_dir)
+        os.makedirs(task.to_working_dir, exist_ok=True)
+        if source:
+            pix_fmt = _color_grade__stream_store(task.to_working_dir,
+                      probe_cache.get(source).video[0], keep)
+            streams.append((task, source, pix_fmt, preset_idx))
+        elif not frame_ext:
+            keep = _color_grade__store(task.to_working_dir,
+                                       frames, keep)
+        if keep and not source:
+            complete = scan_complete_frames(task.to_working_dir)
+            for to_file in list(frames):
+                if os.path.basename(to_file) in complete:
+                    del frames[to_file]
+            log.warning(f'{len(complete)} frames in '
+                        f'"{task.to_working_dir}" have been kept')
+        with open(luts_file, 'w') as f:
+            json.dump(luts, f)
         for to_file, (from_file, preset_idx) in sorted(frames.items()):
             buf.append((to_file, from_file, preset_idx))
+        if deflicker:
+            series.append(sequence)
         active_tasks.append(task)
-        working_dirs.append(task.to_working_dir)
-    physical_cores = psutil.cpu_count(logical=False)
-    total, que = get_que(buf, physical_cores, 5, 500)
-    color_gradation = _ColorGradation(preset_map)
-    with multiprocessing.Pool(physical_cores) as pool:
-        result = pool.map_async(color_gradation.apply_lut, que)
-        complete = False
-        files = 0
-        for i in rich.progress.track(
-            range(1, total+1), total=total, description='Grading ...'
-        ):
-            if complete or result.ready():
-                complete = True
-                continue
-            if files > i:
-                continue
-            while i > files:
-                time.sleep(6)
-                files = get_directory_contents(working_dirs)
-        while not result.ready():
-            time.sleep(1.)
+    processes, queue_depth, footprint = _color_grade__processes(
+          buf, preset_map, psutil.cpu_count(logical=False), frame_ext)
+    total = len(buf)
+    for task, source, pix_fmt, preset_idx in streams:
+        store = get_frame_store(task.to_working_dir)
+        total += len(store.names) - store.count()
+    scheduler = FrameScheduler(buf, processes, 5, 500,
+                               weight=_color_grade__weight)
+    if frame_cache is not None and not frame_ext:
+        log.warning('frames in a frame store cannot be cached, '
+                    'the frame cache is disabled')
+        frame_cache = None
+    if frame_cache is not None:
+        frame_cache = os.path.abspath(frame_cache)
+        os.makedirs(frame_cache, exist_ok=True)
+    preset_keys = {preset_idx: _color_grade__preset_key(lut_files)
+                   for preset_idx, lut_files in preset_map.items()}
+    color_gradation = _ColorGradation(preset_map, preset_keys,
+                          frame_cache, png_compression, queue_depth)
+    if series:
+        color_gradation.gains = _color_grade__gains(
+                                color_gradation, processes, series)
+    stats = collections.Counter()
+    with multiprocessing.Pool(processes,
+                              initializer=_color_grade__init,
+                              initargs=(color_gradation,)) as pool:
+        with StageProgress('Grading ...', total) as progress:
+            for pid, frames, chunk_stats in scheduler.run(
+                                    pool, _color_grade__apply_lut):
+                stats.update(chunk_stats)
+                progress.advance(frames, f'worker {pid}')
+            for task, source, pix_fmt, preset_idx in streams:
+                _color_grade__stream(pool, processes, progress, task,
+                                     source, pix_fmt, preset_idx)
     for task in active_tasks:
-        with open(task.to_done_file, 'w'):
-            pass
-        if os.path.isdir(task.from_working_dir):
-            shutil.rmtree(task.from_working_dir)
-    summary(input_dir, 2)
+        if deflicker:
+            mark_done(task._replace(
+                 to_working_dir=os.path.join(task.dst_dir,
+                                             WORKING_DIRS[2-1]),
+                 to_done_file=os.path.join(task.dst_dir, DONE_FILES[2-1])))
+        mark_done(task)
+        if task.from_working_dir is not None:
+            remove_from_working_dir(task)
+    caption = f'{processes} workers, ' \
+              f'{format_size(footprint)} per worker\n' \
+              f'LUT cache: {stats["lut_hits"]} hits, ' \
+              f'{stats["lut_misses"]} misses'
+    if frame_cache is not None:
+        evict_frame_cache(frame_cache, frame_cache__max_bytes)
+        lookups = stats['frame_hits'] + stats['frame_misses']
+        caption += f'\nFrame cache: {stats["frame_hits"]}/{lookups} hits' \
+                   f' ({stats["frame_hits"] / max(lookups, 1):.0%}), ' \
+                   f'{format_size(stats["bytes_saved"])} saved'
+    if deflicker:
+        summary(input_dir, 4, caption)
+        markdown('''\
+Once you have completed the above steps, \
+re-execute this program with the "-5" parameter \
+to perform the next step "Interpolation".''')
+        return
+    summary(input_dir, 2, caption)
     markdown('''\
 Once you have completed the above steps, \
 re-execute this program with the "-3" parameter \
 to perform the next step "LDR Enhancement".''')
 
+def _color_grade__luts(luts_file):
+    try:
+        with open(luts_file) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def _color_grade__store(to_working_dir, frames, keep):
+    names = sorted(os.path.basename(to_file) for to_file in frames)
+    img = read_frame(min(frames.values())[0])
+    return prepare_frame_store(to_working_dir, names,
+                               img.shape, img.dtype, keep)
+
+def _color_grade__gains(color_gradation, processes, series):
+
+    import multiprocessing
+
+    buf = [frame for frames in series for frame in frames]
+    lums = {}
+    scheduler = FrameScheduler(buf, processes, 5, 500,
+                               weight=_color_grade__weight)
+    with multiprocessing.Pool(processes,
+                              initializer=_color_grade__init,
+                              initargs=(color_gradation,)) as pool:
+        with StageProgress('Measuring ...', len(buf)) as progress:
+            for pid, frames, values in scheduler.run(
+                                  pool, _color_grade__luminance):
+                lums.update(values)
+                progress.advance(frames, f'worker {pid}')
+    gains = {}
+    for frames in series:
+        to_files = [to_file for to_file, from_file, preset_idx in frames]
+        gains.update(zip(to_files, deflicker_gains(
+                     [lums[to_file] for to_file in to_files]).tolist()))
+    return gains
+
+def _color_grade__source(task):
+    from_working_dir = task.from_working_dir
+    if from_working_dir is None or not os.path.isdir(from_working_dir):
+        return task.src
+    if list_frames(from_working_dir):
+        return None
+    for name in sorted(os.listdir(from_working_dir)):
+        if os.path.splitext(name)[1].lower() in VIDEO_EXTS:
+            return os.path.join(from_working_dir, name)
+    return None
+
+def _color_grade__stream_store(to_working_dir, video0, keep):
+    shape = (int(video0.height), int(video0.width), 3)
+    if re.search(r'(9|10|12|14|16)(le|be)$', video0.pix_fmt.strip()):
+        pix_fmt, dtype = 'bgr48le', '<u2'
+    else:
+        pix_fmt, dtype = 'bgr24', '|u1'
+    try:
+        frames = int(video0.nb_frames)
+    except (AttributeError, ValueError):
+        numerator, denominator = video0.avg_frame_rate.split('/')
+        frames = math.ceil(float(video0.duration)
+                 * float(numerator) / float(denominator))
+    width = max(5, len(str(frames)))
+    names = ['%0*d' % (width, i) for i in range(1, frames + 1)]
+    if prepare_frame_store(to_working_dir, names, shape, dtype, keep):
+        log.warning(f'{get_frame_store(to_working_dir).count()} frames '
+                    f'in "{to_working_dir}" have been kept')
+    return pix_fmt
+
+def _color_grade__stream(pool, processes, progress, task,
+                         source, pix_fmt, preset_idx):
+
+    import multiprocessing.shared_memory
+    import queue
+
+    store = get_frame_store(task.to_working_dir)
+    slots = max(stream__ring_frames, processes + 1)
+    ring = multiprocessing.shared_memory.SharedMemory(
+           create=True, size=store.stride * slots)
+    free = collections.deque(range(slots))
+    done = queue.Queue()
+    pending = 0
+    def collect():
+        result = done.get()
+        if isinstance(result, BaseException):
+            raise result
+        pid, slot = result
+        free.append(slot)
+        progress.advance(1, f'worker {pid}')
+    args = ['/usr/bin/ffmpeg', '-v', 'error', '-noautorotate',
+            '-i', source, '-map', '0:v:0',
+            '-f', 'rawvideo', '-pix_fmt', pix_fmt, '-']
+    try:
+        with subprocess.Popen(args, stdout=subprocess.PIPE,
+                              stderr=subprocess.DEVNULL) as proc:
+            try:
+                for i, name in enumerate(store.names):
+                    while not free:
+                        collect()
+                        pending -= 1
+                    slot = free.popleft()
+                    view = ring.buf[slot*store.stride:(slot+1)*store.stride]
+                    try:
+                        size = read_exactly(proc.stdout, view)
+                    finally:
+                        view.release()
+                    if size < store.stride:
+                        free.append(slot)
+                        log.warning(f'"{source}" has only {i} frames, '
+                                    f'{len(store.names)} expected')
+                        break
+                    if store.flags[i]:
+                        free.append(slot)
+                        continue
+                    pool.apply_async(_color_grade__apply_lut_shared,
+                         (ring.name, store.shape, store.dtype.str, slot,
+                          os.path.join(task.to_working_dir, name),
+                          preset_idx),
+                         callback=done.put, error_callback=done.put)
+                    pending += 1
+                else:
+                    if proc.stdout.read(1):
+                        log.warning(f'"{source}" has more than '
+                                    f'{len(store.names)} frames, '
+                                    'the rest has been dropped')
+            finally:
+                proc.kill()
+                while pending:
+                    collect()
+                    pending -= 1
+    finally:
+        ring.close()
+        ring.unlink()
+
+def _color_grade__processes(buf, preset_map, physical_cores, frame_ext):
+
+    import numpy
+    import tracemalloc
+
+    peak = read_bytes = write_bytes = 0
+    if buf:
+        to_file, from_file, preset_idx = buf[0]
+        tracemalloc.start()
+        try:
+            src = img = read_frame(from_file)
+            for lut_file in preset_map[preset_idx]:
+                img = load_cube(lut_file).apply(img)
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+        if not isinstance(src, numpy.memmap):
+            read_bytes = img.nbytes
+        if frame_ext:
+            write_bytes = img.nbytes
+    budget = psutil.virtual_memory().available * memory__budget
+    for queue_depth in range(grade__queue_depth, 0, -1):
+        footprint = memory__worker_overhead + peak \
+                  + queue_depth * (read_bytes + write_bytes)
+        processes = int(budget // footprint)
+        if processes >= physical_cores:
+            break
+    processes = min(max(processes, 1), physical_cores)
+    if processes < physical_cores:
+        log.warning(f'{processes} of {physical_cores} workers fit in '
+                    f'{format_size(int(budget))} of memory '
+                    f'({format_size(footprint)} per worker)')
+    return processes, queue_depth, footprint
+
+def _color_grade__preset_key(lut_files):
+
+    import hashlib
+
+    key = hashlib.blake2b(lut__interpolation.encode(), digest_size=20)
+    for lut_file in lut_files:
+        with open(lut_file, 'rb') as f:
+            key.update(f.read())
+    return key.digest()
+
+def _color_grade__weight(frame):
+    to_file, from_file, preset_idx = frame
+    return get_frame_size(from_file)
+
+def _color_grade__init(color_gradation):
+    global _color_gradation
+    _color_gradation = color_gradation
+
+def _color_grade__apply_lut(frames):
+    return _color_gradation.apply_lut(frames)
+
+def _color_grade__luminance(frames):
+    return _color_gradation.luminance(frames)
+
+def _color_grade__apply_lut_shared(*args):
+    return _color_gradation.apply_lut_shared(*args)
+
 class _ColorGradation:
 
-    def __init__(self, preset_map):
+    def __init__(self, preset_map, preset_keys=None, frame_cache=None,
+                       png_compression=None, queue_depth=None):
         self.preset_map = preset_map
+        self.preset_keys = preset_keys
+        self.frame_cache = frame_cache
+        self.png_compression = png_compression
+        if queue_depth is None:
+            queue_depth = grade__queue_depth
+        self.queue_depth = queue_depth
+        self.executor = None
+        self.ring = None
+        self.gains = None
 
     def apply_lut(self, frames):
 
-        import ApplyLUT
-        import cv2
-        import numpy
+        import concurrent.futures
 
+        if self.executor is None:
+            self.executor = concurrent.futures.ThreadPoolExecutor(
+                            grade__io_threads)
+        stats = collections.Counter()
+        lut_stats = collections.Counter(_lut_cache_stats)
         prev = -1
         luts = None
-        for to_file, from_file, preset_idx in frames:
+        frames = iter(frames)
+        reads = collections.deque()
+        writes = collections.deque()
+        for frame in frames:
+            reads.append(self.executor.submit(self.read, frame))
+            if len(reads) >= self.queue_depth:
+                break
+        while reads:
+            frame, img, cache_file, size = reads.popleft().result()
+            for next_frame in frames:
+                reads.append(self.executor.submit(self.read, next_frame))
+                break
+            to_file, from_file, preset_idx = frame
+            if cache_file is not None:
+                if img is None:
+                    stats['frame_hits'] += 1
+                    stats['bytes_saved'] += size
+                    continue
+                stats['frame_misses'] += 1
             if preset_idx != prev:
                 prev = preset_idx
                 luts = []
                 for lut_file in self.preset_map[preset_idx]:
-                    luts.append(ApplyLUT.ApplyLUT(
-                       os.path.abspath(lut_file)))
-            img = cv2.imread(from_file)
+                    luts.append(get_cube(lut_file))
+            if not os.path.splitext(to_file)[1]:
+                out = get_frame_store(os.path.dirname(to_file),
+                          'r+').slot(os.path.basename(to_file))
+            elif img.flags.writeable:
+                out = img
+            else:
+                out = None
             for lut in luts:
-                tmp = img / 255
-                h, w, c = tmp.shape
-                seq = numpy.reshape(tmp, (h*w, c)).astype(numpy.float64)
-                if seq.max() > 1:
-                    seq = seq / 255
-                img = numpy.reshape(lut.apply_lut_1d(seq), (h, w, c)) \
-                    * 255
-            cv2.imwrite(to_file, img)
+                img = lut.apply(img, out=out)
+                out = img
+            if self.gains is not None:
+                img = apply_gain(img, self.gains[to_file], out)
+            while len(writes) >= self.queue_depth:
+                writes.popleft().result()
+            writes.append(self.executor.submit(
+                          self.write, to_file, img, cache_file))
+        for write in writes:
+            write.result()
+        lut_stats = collections.Counter(_lut_cache_stats) - lut_stats
+        stats['lut_hits'] = lut_stats['hits']
+        stats['lut_misses'] = lut_stats['misses']
+        return stats
+
+    def luminance(self, frames):
+
+        import numpy
+
+        values = []
+        for to_file, from_file, preset_idx in frames:
+            img = numpy.ascontiguousarray(read_frame(from_file)
+                  [::deflicker__stats_stride, ::deflicker__stats_stride])
+            for lut_file in self.preset_map[preset_idx]:
+                img = get_cube(lut_file).apply(img)
+            values.append((to_file, frame_luminance(img)))
+        return values
+
+    def apply_lut_shared(self, ring, shape, dtype, slot, to_file,
+                               preset_idx):
+
+        import multiprocessing.resource_tracker
+        import multiprocessing.shared_memory
+        import numpy
+
+        if self.ring is None or self.ring.name != ring:
+            if self.ring is not None:
+                self.ring.close()
+            self.ring = multiprocessing.shared_memory.SharedMemory(ring)
+            multiprocessing.resource_tracker.unregister(
+                            self.ring._name, 'shared_memory')
+        dtype = numpy.dtype(dtype)
+        img = numpy.ndarray(shape, dtype, self.ring.buf,
+                            slot * math.prod(shape) * dtype.itemsize)
+        out = get_frame_store(os.path.dirname(to_file),
+                  'r+').slot(os.path.basename(to_file))
+        for lut_file in self.preset_map[preset_idx]:
+            img = get_cube(lut_file).apply(img, out=out)
+        write_frame(to_file, img)
+        return os.getpid(), slot
+
+    def read(self, frame):
+
+        import hashlib
+        import numpy
+
+        to_file, from_file, preset_idx = frame
+        if self.frame_cache is None \
+           or not os.path.splitext(from_file)[1]:
+            return frame, read_frame(from_file), None, None
+        data = numpy.fromfile(from_file, dtype=numpy.uint8)
+        key = hashlib.blake2b(data, digest_size=20,
+                  key=self.preset_keys[preset_idx]).hexdigest()
+        ext = os.path.splitext(to_file)[1]
+        cache_file = os.path.join(self.frame_cache, key[:2], key[2:] + ext)
+        size = link_cached_frame(cache_file, to_file)
+        if size is not None:
+            return frame, None, cache_file, size
+        return frame, decode_frame(data, os.path.splitext(from_file)[1]), \
+               cache_file, None
+
+    def write(self, to_file, img, cache_file):
+        write_frame(to_file, img, self.png_compression)
+        if cache_file is not None:
+            store_cached_frame(to_file, cache_file)
+
+def link_cached_frame(cache_file, to_file):
+    try:
+        size = os.stat(cache_file).st_size
+        if os.path.exists(to_file):
+            os.remove(to_file)
+        try:
+            os.link(cache_file, to_file)
+        except OSError:
+            shutil.copyfile(cache_file, to_file)
+        os.utime(cache_file)
+    except FileNotFoundError:
+        return None
+    return size
+
+def store_cached_frame(to_file, cache_file):
+    os.makedirs(os.path.dirname(cache_file), exist_ok=True)
+    temp_file = f'{cache_file}.{os.getpid()}.tmp'
+    try:
+        try:
+            os.link(to_file, temp_file)
+        except OSError:
+            shutil.copyfile(to_file, temp_file)
+        os.replace(temp_file, cache_file)
+    except OSError as e:
+        log.warning(f'cannot cache "{to_file}": {e}')
+
+def evict_frame_cache(frame_cache, max_bytes):
+    entries = []
+    total = 0
+    for dir_entry in os.scandir(frame_cache):
+        if not dir_entry.is_dir():
+            continue
+        for entry in os.scandir(dir_entry.path):
+            st = entry.stat()
+            entries.append((st.st_mtime, st.st_size, entry.path))
+            total += st.st_size
+    entries.sort()
+    for mtime, size, path in entries:
+        if total <= max_bytes:
+            break
+        os.remove(path)
+        total -= size
+
+class CubeLUT:
+
+    def __init__(self, table, domain_min=(0., 0., 0.),
+                              domain_max=(1., 1., 1.)):
+
+        import numpy
+
+        self.size = table.shape[0]
+        self.table = numpy.ascontiguousarray(
+                     table.reshape(-1, 3), dtype=numpy.float32)
+        self.domain_min = numpy.array(domain_min, dtype=numpy.float32)
+        self.domain_max = numpy.array(domain_max, dtype=numpy.float32)
+        self.strides = numpy.array(
+                       [1, self.size, self.size**2], dtype=numpy.int32)
+        self._axis_tables = {}
+
+    def save(self, lut_file):
+        with open(lut_file, 'w') as f:
+            f.write(f'LUT_3D_SIZE {self.size}\n')
+            f.write('DOMAIN_MIN %.6f %.6f %.6f\n' % tuple(self.domain_min))
+            f.write('DOMAIN_MAX %.6f %.6f %.6f\n' % tuple(self.domain_max))
+            for row in self.table:
+                f.write('%.6f %.6f %.6f\n' % tuple(row))
+
+    def apply(self, img, out=None, method=None):
+
+        import numpy
+
+        if method is None:
+            method = lut__interpolation
+        if img.dtype == numpy.uint8:
+            max_value = 255
+        elif img.dtype == numpy.uint16:
+            max_value = 65535
+        elif img.dtype == numpy.float32:
+            max_value = None
+        else:
+            raise TypeError(f'unsupported frame type {img.dtype}')
+        if out is None:
+            out = numpy.empty_like(img)
+        src = img.reshape(-1, 3)
+        dst = out.reshape(-1, 3)
+        if max_value is not None:
+            axes = self._get_axis_tables(max_value)
+        for start in range(0, len(src), lut__strip_pixels):
+            stop = start + lut__strip_pixels
+            if max_value is None:
+                base, fractions = self._locate(src[start:stop])
+            else:
+                base = None
+                fractions = []
+                for c, (indices, fraction) in enumerate(axes):
+                    v = src[start:stop, c]
+                    if base is None:
+                        base = numpy.take(indices, v)
+                    else:
+                        base += numpy.take(indices, v)
+                    fractions.append(numpy.take(fraction, v))
+            y = self._interpolate(base, *fractions, method)
+            if max_value is not None:
+                y *= max_value
+                y += .5
+                numpy.clip(y, 0., max_value, out=y)
+            dst[start:stop] = y
+        return out
+
+    def _get_axis_tables(self, max_value):
+
+        import numpy
+
+        if max_value not in self._axis_tables:
+            self._axis_tables[max_value] = [self._locate_axis(
+                  numpy.arange(max_value+1, dtype=numpy.float32)
+                  / max_value, c) for c in range(3)]
+        return self._axis_tables[max_value]
+
+    def _locate_axis(self, v, c):
+
+        import numpy
+
+        x = (v - self.domain_min[c]) * ((self.size - 1)
+          / (self.domain_max[c] - self.domain_min[c]))
+        numpy.clip(x, 0., self.size - 1, out=x)
+        i = numpy.minimum(x.astype(numpy.int32), self.size - 2)
+        x -= i
+        i *= self.strides[c]
+        return i, x
+
+    def _locate(self, seq):
+
+        import numpy
+
+        base = None
+        fractions = []
+        for c in range(3):
+            i, x = self._locate_axis(seq[:, c].astype(numpy.float32), c)
+            if base is None:
+                base = i
+            else:
+                base += i
+            fractions.append(x)
+        return base, fractions
+
+    def _interpolate(self, base, r, g, b, method):
+
+        import numpy
+
+        s0, s1, s2 = (int(stride) for stride in self.strides)
+        table = self.table
+        def corner(offset):
+            return numpy.take(table, base + offset, axis=0)
+        if 'tetrahedral' == method:
+            r_max = (r >= g) & (r >= b)
+            g_max = ~r_max & (g >= b)
+            b_min = (b <= r) & (b <= g)
+            g_min = ~b_min & (g <= r)
+            s_max = numpy.where(r_max, s0, numpy.where(g_max, s1, s2))
+            s_min = numpy.where(b_min, s2, numpy.where(g_min, s1, s0))
+            d_max = numpy.maximum(numpy.maximum(r, g), b)
+            d_min = numpy.minimum(numpy.minimum(r, g), b)
+            d_mid = r + g + b - d_max - d_min
+            y = corner(0)
+            y *= (1. - d_max)[:, None]
+            c = corner(s_max)
+            c *= (d_max - d_mid)[:, None]
+            y += c
+            c = corner((s0 + s1 + s2) - s_min)
+            c *= (d_mid - d_min)[:, None]
+            y += c
+            c = corner(s0 + s1 + s2)
+            c *= d_min[:, None]
+            y += c
+        elif 'trilinear' == method:
+            planes = []
+            for db in (0, s2):
+                lines = []
+                for dg in (0, s1):
+                    c0 = corner(db + dg)
+                    c1 = corner(db + dg + s0)
+                    c1 -= c0
+                    c1 *= r[:, None]
+                    c1 += c0
+                    lines.append(c1)
+                lines[1] -= lines[0]
+                lines[1] *= g[:, None]
+                lines[1] += lines[0]
+                planes.append(lines[1])
+            planes[1] -= planes[0]
+            planes[1] *= b[:, None]
+            planes[1] += planes[0]
+            y = planes[1]
+        else:
+            raise ValueError(f'unknown interpolation method "{method}"')
+        return y
+
+def get_cube(lut_file):
+    path = os.path.realpath(lut_file)
+    key = (path, os.stat(path).st_mtime_ns)
+    if key in _lut_cache:
+        _lut_cache.move_to_end(key)
+        _lut_cache_stats['hits'] += 1
+    else:
+        _lut_cache_stats['misses'] += 1
+        _lut_cache[key] = load_cube(path)
+        while len(_lut_cache) > lut_cache__max_size:
+            _lut_cache.popitem(last=False)
+    return _lut_cache[key]
+
+def load_cube(lut_file):
+
+    import numpy
+
+    size = None
+    domain_min = (0., 0., 0.)
+    domain_max = (1., 1., 1.)
+    values = []
+    with open(lut_file) as f:
+        for line in f:
+            fields = line.split()
+            if not fields or fields[0].startswith('#'):
+                continue
+            keyword = fields[0].upper()
+            if 'LUT_3D_SIZE' == keyword:
+                size = int(fields[1])
+            elif 'LUT_1D_SIZE' == keyword:
+                raise ValueError(f'"{lut_file}" is not a 3D LUT')
+            elif 'DOMAIN_MIN' == keyword:
+                domain_min = tuple(map(float, fields[1:4]))
+            elif 'DOMAIN_MAX' == keyword:
+                domain_max = tuple(map(float, fields[1:4]))
+            elif 'LUT_3D_INPUT_RANGE' == keyword:
+                domain_min = (float(fields[1]),) * 3
+                domain_max = (float(fields[2]),) * 3
+            elif keyword[0] in '+-.0123456789':
+                values.extend(fields[:3])
+    if size is None:
+        raise ValueError(f'"{lut_file}" is not a 3D LUT')
+    table = numpy.array(values, dtype=numpy.float32)
+    if table.size != size**3 * 3:
+        raise ValueError(f'"{lut_file}" has {table.size//3} entries, '
+                         f'{size**3} expected')
+    return CubeLUT(table.reshape(size, size, size, 3),
+                   domain_min, domain_max)
+
+def bake_luts(lut_files, baked_file):
 
-def ldr_enhance(input_, easyhdr_path):
+    import numpy
+
+    luts = [load_cube(os.path.abspath(lut_file)) for lut_file in lut_files]
+    size = max([lut_bake__min_size] + [lut.size for lut in luts])
+    grid = numpy.linspace(0., 1., size, dtype=numpy.float32)
+    b, g, r = numpy.meshgrid(grid, grid, grid, indexing='ij')
+    seq = numpy.stack([r.ravel(), g.ravel(), b.ravel()], axis=1)
+    for lut in luts:
+        seq = lut.apply(seq)
+    baked = CubeLUT(seq.reshape(size, size, size, 3))
+    baked.save(baked_file)
+    rng = numpy.random.default_rng(0)
+    samples = rng.random((4096, 3), dtype=numpy.float32)
+    expected = samples
+    for lut in luts:
+        expected = lut.apply(expected)
+    error = numpy.abs(baked.apply(samples) - expected).max() * 255
+    if error > lut_bake__tolerance:
+        log.warning(f'baked LUT "{baked_file}" deviates from '
+                    f'the LUT chain by {error:.2f}/255')
+    return baked_file
+
+def ldr_enhance(input_, easyhdr_path, pack=False):
 
     import rich.columns
     import rich.syntax
@@ -236,8 +932,9 @@ def ldr_enhance(input_, easyhdr_path):
         preset_file = os.path.join(task.dst_dir, 'easyhdr_preset')
         if os.path.isfile(preset_file):
             continue
-        image = QFileDialogPreview.open_(
-                'Sampling', task.from_working_dir, '*.png *.jpg *.jpeg')
+        convert_frames(task.from_working_dir, EASYHDR_EXTS)
+        image = QFileDialogPreview.open_('Sampling', task.from_working_dir,
+                        ' '.join('*' + ext for ext in EASYHDR_EXTS))
         if image is not None:
             root = os.path.splitext(os.path.basename(task.src))[0]
             ext = os.path.splitext(image)[1]
@@ -286,13 +983,16 @@ def ldr_enhance(input_, easyhdr_path):
             log.warning(f'directory "{task.to_working_dir}" '
                         'has been reset')
         clean_other_files(task.from_working_dir)
+        convert_frames(task.from_working_dir, EASYHDR_EXTS)
         os.mkdir(task.to_working_dir)
         active_tasks.append(task)
         working_dirs.append(task.to_working_dir)
         for name in sorted(os.listdir(task.from_working_dir)):
             buf.append((task.from_working_dir, name, preset))
     physical_cores = psutil.cpu_count(logical=False)
-    total, que = get_que(buf, physical_cores, 50, 5000)
+    total = len(buf)
+    que = FrameScheduler(buf, physical_cores, 50, 5000,
+                         weight=_ldr_enhance__weight)
     temp_dir_holder = temprary_directory_holder(suffix='_easyHDR')
     temp_dir = next(temp_dir_holder)
     for idx, frames in enumerate(que, start=1):
@@ -314,10 +1014,9 @@ def ldr_enhance(input_, easyhdr_path):
             f.write('''
 </Tasks></easyHDRbatch>''')
     processes = min(physical_cores, len(os.listdir(temp_dir)))
-    procs = []
+    supervisor = ProcessSupervisor({'easyHDR': processes})
     for i in range(processes):
-        procs.append(subprocess.Popen(['/usr/bin/wine-stable', easyhdr],
-                  stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL))
+        supervisor.submit('easyHDR', ['/usr/bin/wine-stable', easyhdr])
     markdown(f'''\
 ## LDR Enhancement
 Now, the "ehtx" files has been generated in a directory named: \
@@ -337,23 +1036,13 @@ nohup wine-stable "{easyhdr}" > /dev/null 2>&1 &''', 'bash'))
     markdown(f'''\
 - Please keep this program until easyHDR processes is complete.''')
     os.chdir(temp_dir)
-    complete = False
-    files = 0
-    for i in rich.progress.track(
-        range(1, total+1), total=total, description='Rendering ...'
-    ):
-        if complete:
-            continue
-        if files > i:
-            continue
-        if _ldr_enhance__procs_ready(procs):
-            complete = True
-            continue
-        while i > files:
-            time.sleep(8)
-            files = get_directory_contents(working_dirs)
-    while not _ldr_enhance__procs_ready(procs):
-        time.sleep(1.)
+    with StageProgress('Rendering ...', total) as progress, \
+         DirectoryWatcher(working_dirs) as watcher:
+        def watch():
+            for working_dir, frames in watcher.wait(1.).items():
+                progress.advance(frames, os.path.basename(
+                                 os.path.dirname(working_dir)))
+        supervisor.run(watch)
     summary(input_dir, 3)
     success = rich.prompt.Confirm.ask('''\
 Did all the easyHDR jobs be successfully completed?''')
@@ -363,10 +1052,10 @@ Did all the easyHDR jobs be successfully completed?''')
             total=len(active_tasks),
             description='Finishing ...'
         ):
-            with open(task.to_done_file, 'w'):
-                pass
-            if os.path.isdir(task.from_working_dir):
-                shutil.rmtree(task.from_working_dir)
+            if pack:
+                pack_frames(task.to_working_dir)
+            mark_done(task)
+            remove_from_working_dir(task)
     summary(input_dir, 3)
     if success:
         rich.print(rich.markdown.Markdown('''\
@@ -377,32 +1066,26 @@ to perform the next step "Time-lapse Deflickering".'''))
 Since this operation is not fully completed, \
 consider re-performing this procedure.'''))
 
-def _ldr_enhance__procs_ready(procs):
-    if procs:
-        to_remove = []
-        for proc in procs:
-            if proc.poll() is not None:
-                to_remove.append(proc)
-        for proc in to_remove:
-            procs.remove(proc)
-        if procs:
-            return False
-        else:
-            return True
-    else:
-        return True
+def _ldr_enhance__weight(frame):
+    from_working_dir, name, preset = frame
+    return os.path.getsize(os.path.join(from_working_dir, name))
 
-def deflicker(input_, deflickering):
+def deflicker(input_, deflickering, resume=False, pack=False):
+
+    import functools
+
+    builtin = 'builtin' == deflickering
     timelapse_deflicker_pl = os.path.abspath(deflickering)
-    if not os.path.isfile(timelapse_deflicker_pl):
+    if not builtin and not os.path.isfile(timelapse_deflicker_pl):
         raise FileNotFoundError(
               errno.ENOENT, f'file "{timelapse_deflicker_pl}" not found')
     markdown('## Time-lapse Deflicker Configuration')
     input_dir = os.path.abspath(input_)
     tasks = get_effective_dirs(input_dir, 4)
     active_tasks = []
-    from_working_dirs = []
     to_working_dirs = []
+    task_frames = []
+    jobs = []
     total_frames = 0
     for task in rich.progress.track(tasks, total=len(tasks),
                                description='Preparing ...'):
@@ -411,6 +1094,25 @@ def deflicker(input_, deflickering):
             log.warning(f'directory "{enhanced}" not exists, '
                         'so it cannot be deflickered, ignored')
             continue
+        if builtin:
+            job = _deflicker__prepare(task, resume, pack)
+            if job is not None:
+                jobs.append(job)
+                active_tasks.append(task)
+            continue
+        deflickered = os.path.join(task.from_working_dir, 'Deflickered')
+        if resume and os.path.isdir(deflickered) \
+           and not os.path.exists(task.to_working_dir) \
+           and len(scan_complete_frames(deflickered)) \
+               == len(list_frames(task.from_working_dir)):
+            log.warning(f'directory "{deflickered}" is complete, '
+                        'so it has been kept')
+            os.rename(deflickered, task.to_working_dir)
+            if pack:
+                pack_frames(task.to_working_dir)
+            mark_done(task)
+            remove_from_working_dir(task)
+            continue
         if os.path.exists(task.to_working_dir):
             if not os.path.isdir(task.to_working_dir):
                 log.warning(f'"{task.to_working_dir}" '
@@ -420,79 +1122,178 @@ def deflicker(input_, deflickering):
             log.warning(f'directory "{task.to_working_dir}" '
                         'has been reset')
         clean_other_files(task.from_working_dir)
-        total_frames += get_directory_contents([task.from_working_dir])
-        deflickered = os.path.join(task.from_working_dir, 'Deflickered')
+        convert_frames(task.from_working_dir, DEFLICKER_EXTS)
+        frames = get_directory_contents([task.from_working_dir])
+        total_frames += frames
         os.mkdir(deflickered)
         active_tasks.append(task)
-        from_working_dirs.append(task.from_working_dir)
+        task_frames.append(frames)
         to_working_dirs.append(deflickered)
+    if builtin:
+        deflicker_frames(jobs)
+        for task in active_tasks:
+            mark_done(task)
+            remove_from_working_dir(task)
+        summary(input_dir, 4)
+        markdown('''\
+Once you have completed the above steps, \
+re-execute this program with the "-5" parameter \
+to perform the next step "Interpolation".''')
+        return
     logical_cores = psutil.cpu_count(logical=True)
-    buf = list(reversed(active_tasks))
-    procs = []
-    complete = False
-    files = 0
-    ratio = 30
-    total = total_frames * (ratio + 2)
-    for i in rich.progress.track(
-        range(1, total+1), total=total, description='Deflickering ...'
-    ):
-        if complete:
-            continue
-        if files > i:
-            continue
-        if _deflicker__procs_ready_finish(
-           timelapse_deflicker_pl, logical_cores, buf, procs):
-            complete = True
-            continue
-        while i > files:
-            if _deflicker__procs_ready_finish(
-               timelapse_deflicker_pl, logical_cores, buf, procs):
-                complete = True
-            time.sleep(6)
-            from_frames = get_directory_contents(from_working_dirs) - 1
-            done_frames = get_directory_contents(to_working_dirs)
-            files = done_frames * (ratio - 1) + from_frames
-    while not _deflicker__procs_ready_finish(
-          timelapse_deflicker_pl, logical_cores, buf, procs):
-        time.sleep(1.)
-    summary(input_dir, 4)
+    supervisor = ProcessSupervisor({'timelapse-deflicker': logical_cores})
+    seconds_per_frame = get_manifest(input_dir).seconds_per_frame(
+                        'timelapse-deflicker')
+    for task, frames in zip(active_tasks, task_frames):
+        supervisor.submit('timelapse-deflicker',
+                          ['/usr/bin/perl', timelapse_deflicker_pl],
+                          task.from_working_dir,
+                          functools.partial(_deflicker__finish,
+                                            task, frames, pack),
+                          frames * seconds_per_frame)
+    with StageProgress('Deflickering ...', total_frames) as progress, \
+         DirectoryWatcher(to_working_dirs) as watcher:
+        def watch():
+            for working_dir, frames in watcher.wait(1.).items():
+                progress.advance(frames, os.path.basename(
+                        os.path.dirname(os.path.dirname(working_dir))))
+        supervisor.run(watch)
+    summary(input_dir, 4, supervisor.makespan)
     markdown('''\
 Once you have completed the above steps, \
 re-execute this program with the "-5" parameter \
 to perform the next step "Interpolation".''')
 
-def _deflicker__procs_ready_finish(
-        timelapse_deflicker_pl, logical_cores, buf, procs
-    ):
-    to_remove = []
-    for elem in procs:
-        proc, task = elem
-        if proc.poll() is not None:
-            deflickered = os.path.join(
-                          task.from_working_dir, 'Deflickered')
-            os.rename(deflickered, task.to_working_dir)
-            with open(task.to_done_file, 'w'):
-                pass
-            if os.path.isdir(task.from_working_dir):
-                shutil.rmtree(task.from_working_dir)
-            to_remove.append(elem)
-    for elem in to_remove:
-        procs.remove(elem)
-    while buf and len(procs) < logical_cores:
-        task = buf.pop()
-        from_working_dir = task.from_working_dir
-        args = ['/usr/bin/perl', timelapse_deflicker_pl]
-        proc = subprocess.Popen(args, cwd=from_working_dir,
-               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
-        procs.append((proc, task))
-    if buf or procs:
-        return False
-    else:
-        return True
+def _deflicker__prepare(task, resume, pack):
+    names = sorted(list_frames(task.from_working_dir))
+    if not names:
+        log.warning('nothing to do with '
+                    f'"{task.to_working_dir}", ignored')
+        return None
+    keep = False
+    if os.path.exists(task.to_working_dir):
+        if not os.path.isdir(task.to_working_dir):
+            log.warning(f'"{task.to_working_dir}" '
+                        'exists but is not a directory')
+            return None
+        keep = resume
+        if not keep:
+            shutil.rmtree(task.to_working_dir)
+            log.warning(f'directory "{task.to_working_dir}" '
+                        'has been reset')
+    clean_other_files(task.from_working_dir)
+    os.makedirs(task.to_working_dir, exist_ok=True)
+    from_files = [os.path.join(task.from_working_dir, name)
+                  for name in names]
+    if pack:
+        names = [os.path.splitext(name)[0] for name in names]
+        img = read_frame(from_files[0])
+        keep = prepare_frame_store(task.to_working_dir, names,
+                                   img.shape, img.dtype, keep)
+    to_files = [os.path.join(task.to_working_dir, name) for name in names]
+    complete = set()
+    if keep:
+        complete = scan_complete_frames(task.to_working_dir)
+        log.warning(f'{len(complete)} frames in '
+                    f'"{task.to_working_dir}" have been kept')
+    return from_files, to_files, complete
+
+def deflicker_frames(jobs):
+
+    import multiprocessing
+    import numpy
+
+    physical_cores = psutil.cpu_count(logical=False)
+    buf = [(idx, i, from_file) for idx, (from_files, to_files, complete)
+           in enumerate(jobs) for i, from_file in enumerate(from_files)]
+    lums = [numpy.ones(len(from_files)) for from_files, to_files,
+            complete in jobs]
+    with multiprocessing.Pool(physical_cores) as pool:
+        scheduler = FrameScheduler(buf, physical_cores, 5, 500)
+        with StageProgress('Measuring ...', len(buf)) as progress:
+            for pid, frames, values in scheduler.run(
+                                  pool, _deflicker__luminance):
+                for idx, i, lum in values:
+                    lums[idx][i] = lum
+                progress.advance(frames, f'worker {pid}')
+        buf = []
+        for (from_files, to_files, complete), lum in zip(jobs, lums):
+            gains = deflicker_gains(lum)
+            for from_file, to_file, gain in zip(from_files, to_files,
+                                                gains):
+                if os.path.basename(to_file) not in complete:
+                    buf.append((to_file, from_file, float(gain)))
+        scheduler = FrameScheduler(buf, physical_cores, 5, 500)
+        with StageProgress('Deflickering ...', len(buf)) as progress:
+            for pid, frames, value in scheduler.run(
+                                  pool, _deflicker__apply_gain):
+                progress.advance(frames, f'worker {pid}')
+    return lums
+
+def deflicker_gains(lum):
+
+    import numpy
+
+    lum = numpy.asarray(lum, dtype=numpy.float64)
+    half = deflicker__window // 2
+    cumsum = numpy.concatenate([[0.], numpy.cumsum(lum)])
+    i = numpy.arange(len(lum))
+    low = numpy.maximum(i - half, 0)
+    high = numpy.minimum(i + half + 1, len(lum))
+    target = (cumsum[high] - cumsum[low]) / (high - low)
+    gains = numpy.ones(len(lum))
+    numpy.divide(target, lum, out=gains, where=lum > 0)
+    return gains
+
+def frame_luminance(img):
 
-def interpolate(input_, interpolation):
+    import numpy
+
+    b, g, r = img.reshape(-1, 3).mean(axis=0, dtype=numpy.float64)
+    return .299 * r + .587 * g + .114 * b
+
+def apply_gain(img, gain, out=None):
+
+    import cv2
+
+    return cv2.multiply(img, (gain, gain, gain, 0), dst=out)
+
+def _deflicker__luminance(frames):
+    values = []
+    for idx, i, from_file in frames:
+        values.append((idx, i, frame_luminance(read_frame(from_file))))
+    return values
+
+def _deflicker__apply_gain(frames):
+    for to_file, from_file, gain in frames:
+        img = read_frame(from_file)
+        if not os.path.splitext(to_file)[1]:
+            out = get_frame_store(os.path.dirname(to_file),
+                      'r+').slot(os.path.basename(to_file))
+        else:
+            out = None
+        write_frame(to_file, apply_gain(img, gain, out))
+
+def _deflicker__finish(task, frames, pack, returncode, stderr, elapsed):
+    if returncode:
+        return
+    record_timing(task, 'timelapse-deflicker', frames, elapsed)
+    deflickered = os.path.join(task.from_working_dir, 'Deflickered')
+    os.rename(deflickered, task.to_working_dir)
+    if pack:
+        pack_frames(task.to_working_dir)
+    mark_done(task)
+    remove_from_working_dir(task)
+
+def interpolate(input_, interpolation, resume=False, pack=False,
+                instances=1, segment=0, arg_g=rife_ncnn_vulkan__arg_g,
+                arg_j=rife_ncnn_vulkan__arg_j):
+
+    import functools
+
+    builtin = 'builtin' == interpolation
     rife_ncnn_vulkan = os.path.abspath(interpolation)
-    if not os.path.isfile(rife_ncnn_vulkan):
+    if not builtin and not os.path.isfile(rife_ncnn_vulkan):
         raise FileNotFoundError(
               errno.ENOENT, f'file "{rife_ncnn_vulkan}" not found')
     markdown('## Interpolation')
@@ -508,86 +1309,243 @@ def interpolate(input_, interpolation):
                 log.warning(f'"{task.to_working_dir}" '
                             'exists but is not a directory')
                 continue
+            if resume and len(scan_complete_frames(task.to_working_dir)) \
+                     >= len(list_frames(task.from_working_dir)) * 2:
+                log.warning(f'directory "{task.to_working_dir}" '
+                            'is complete, so it has been kept')
+                if pack:
+                    pack_frames(task.to_working_dir)
+                mark_done(task)
+                remove_from_working_dir(task)
+                continue
             shutil.rmtree(task.to_working_dir)
             log.warning(f'directory "{task.to_working_dir}" '
                         'has been reset')
         clean_other_files(task.from_working_dir)
+        if not builtin:
+            convert_frames(task.from_working_dir, RIFE_EXTS)
         total += get_directory_contents([task.from_working_dir])
         os.mkdir(task.to_working_dir)
         active_tasks.append(task)
         working_dirs.append(task.to_working_dir)
-    buf = list(reversed(active_tasks))
-    procs = []
-    complete = False
-    files = 0
-    for i in rich.progress.track(
-        range(1, total*2+1),
-        total=total*2,
-        description='Interpolating ...'
-    ):
-        if complete:
-            continue
-        if files > i:
-            continue
-        if _interpolate__procs_ready_finish(
-               rife_ncnn_vulkan, buf, procs):
-            complete = True
-            continue
-        while i > files:
-            time.sleep(6)
-            if _interpolate__procs_ready_finish(
-                   rife_ncnn_vulkan, buf, procs):
-                complete = True
-            files = get_directory_contents(working_dirs)
-    while not _interpolate__procs_ready_finish(
-                  rife_ncnn_vulkan, buf, procs):
-        time.sleep(1.)
-    summary(input_dir, 5)
+    if builtin:
+        processes, frames, elapsed = interpolate_frames(
+            [([os.path.join(task.from_working_dir, name) for name in
+               sorted(list_frames(task.from_working_dir))],
+              task.to_working_dir) for task in active_tasks], pack)
+        for task in active_tasks:
+            mark_done(task)
+            remove_from_working_dir(task)
+        summary(input_dir, 5, f'{frames / max(elapsed, 1e-9) / processes:.2f}'
+                              f' fps per core ({processes} workers)')
+        markdown('''\
+Once you have completed the above steps, \
+re-execute this program with the "-6" parameter \
+to perform the next step "Mergence".''')
+        return
+    command = get_command(rife_ncnn_vulkan) + ['-g', arg_g, '-j', arg_j]
+    supervisor = ProcessSupervisor({'rife-ncnn-vulkan': instances})
+    seconds_per_frame = get_manifest(input_dir).seconds_per_frame(
+                        'rife-ncnn-vulkan')
+    pending = {}
+    for task in active_tasks:
+        jobs = _interpolate__segments(task, segment)
+        pending[task.to_working_dir] = len(jobs)
+        for job in jobs:
+            task, segment_dir, first, keep = job
+            if segment_dir is None:
+                from_dir = task.from_working_dir
+                to_dir = task.to_working_dir
+            else:
+                from_dir = os.path.join(segment_dir, 'in')
+                to_dir = os.path.join(segment_dir, 'out')
+            frames = len(list_frames(from_dir))
+            supervisor.submit('rife-ncnn-vulkan',
+                              command + ['-i', from_dir, '-o', to_dir],
+                              os.path.dirname(rife_ncnn_vulkan),
+                              functools.partial(_interpolate__finish,
+                                                job, frames, pending, pack),
+                              frames * seconds_per_frame)
+    with StageProgress('Interpolating ...', total*2) as progress, \
+         DirectoryWatcher(working_dirs) as watcher:
+        def watch():
+            for working_dir, frames in watcher.wait(1.).items():
+                progress.advance(frames, os.path.basename(
+                                 os.path.dirname(working_dir)))
+        supervisor.run(watch)
+    summary(input_dir, 5, supervisor.makespan)
     markdown('''\
 Once you have completed the above steps, \
 re-execute this program with the "-6" parameter \
 to perform the next step "Mergence".''')
 
-def _interpolate__procs_ready_finish(rife_ncnn_vulkan, buf, procs):
-    to_remove = []
-    for elem in procs:
-        proc, task = elem
-        if proc.poll() is not None:
-            with open(task.to_done_file, 'w'):
-                pass
-            if os.path.isdir(task.from_working_dir):
-                shutil.rmtree(task.from_working_dir)
-            to_remove.append(elem)
-    for elem in to_remove:
-        procs.remove(elem)
-    while buf and len(procs) < 1:
-        task = buf.pop()
-        args = [ld_linux, rife_ncnn_vulkan,
-                '-g', rife_ncnn_vulkan__arg_g,
-                '-j', rife_ncnn_vulkan__arg_j,
-                '-i', task.from_working_dir, '-o', task.to_working_dir]
-        proc = subprocess.Popen(
-               args, cwd=os.path.dirname(rife_ncnn_vulkan),
-               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
-        procs.append((proc, task))
-    if buf or procs:
-        return False
-    else:
-        return True
+def interpolate_frames(jobs, pack=False):
+
+    import multiprocessing
+
+    buf = []
+    for from_files, to_working_dir in jobs:
+        names = ['%08d' % (i + 1) for i in range(len(from_files) * 2)]
+        if pack:
+            img = read_frame(from_files[0])
+            prepare_frame_store(to_working_dir, names, img.shape, img.dtype)
+        else:
+            names = [name + '.png' for name in names]
+        to_files = [os.path.join(to_working_dir, name) for name in names]
+        for i, from_file in enumerate(from_files):
+            next_file = from_files[i+1] if i + 1 < len(from_files) else None
+            buf.append((from_file, next_file,
+                        to_files[i*2], to_files[i*2+1]))
+    physical_cores = psutil.cpu_count(logical=False)
+    total = len(buf) * 2
+    scheduler = FrameScheduler(buf, physical_cores, 5, 500)
+    start = time.perf_counter()
+    with multiprocessing.Pool(physical_cores) as pool:
+        with StageProgress('Interpolating ...', total) as progress:
+            for pid, pairs, value in scheduler.run(
+                                 pool, _interpolate__flow):
+                progress.advance(pairs * 2, f'worker {pid}')
+    return physical_cores, total, time.perf_counter() - start
+
+def _interpolate__flow(pairs):
+    prev_file = prev = None
+    for from_file, next_file, to_file, mid_file in pairs:
+        img0 = prev if from_file == prev_file else read_frame(from_file)
+        write_frame(to_file, img0)
+        if next_file is None:
+            write_frame(mid_file, img0)
+            continue
+        img1 = read_frame(next_file)
+        write_frame(mid_file, interpolate_frame(img0, img1))
+        prev_file, prev = next_file, img1
+
+def interpolate_frame(img0, img1, t=.5):
+
+    import cv2
+    import numpy
+
+    global _dis
+    if _dis is None:
+        _dis = cv2.DISOpticalFlow_create(
+               cv2.DISOPTICAL_FLOW_PRESET_MEDIUM)
+    height, width = img0.shape[:2]
+    if min(height, width) < 32:
+        return cv2.addWeighted(img0, 1 - t, img1, t, 0)
+    gray0 = _interpolate__gray(img0)
+    gray1 = _interpolate__gray(img1)
+    flows = []
+    for a, b in [(gray0, gray1), (gray1, gray0)]:
+        flow = _dis.calc(a, b, None)
+        if flow.shape[:2] != (height, width):
+            flow = cv2.resize(flow, (width, height),
+                              interpolation=cv2.INTER_LINEAR)
+            flow *= width / a.shape[1]
+        flows.append(flow)
+    flow01, flow10 = flows
+    flow_t0 = flow01 * (-(1 - t) * t) + flow10 * (t * t)
+    flow_t1 = flow01 * ((1 - t) ** 2) - flow10 * (t * (1 - t))
+    grid_y, grid_x = numpy.mgrid[0:height, 0:width].astype(numpy.float32)
+    warped = []
+    for img, flow in [(img0, flow_t0), (img1, flow_t1)]:
+        warped.append(cv2.remap(img, grid_x + flow[..., 0],
+                      grid_y + flow[..., 1], cv2.INTER_LINEAR,
+                      borderMode=cv2.BORDER_REPLICATE))
+    return cv2.addWeighted(warped[0], 1 - t, warped[1], t, 0)
+
+def _interpolate__gray(img):
+
+    import cv2
+    import numpy
+
+    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+    if gray.dtype != numpy.uint8:
+        gray = (gray >> 8).astype(numpy.uint8)
+    if interpolate__flow_scale != 1:
+        gray = cv2.resize(gray, None, fx=interpolate__flow_scale,
+                          fy=interpolate__flow_scale,
+                          interpolation=cv2.INTER_AREA)
+    return gray
+
+def _interpolate__segments(task, segment):
+    names = sorted(list_frames(task.from_working_dir))
+    if not segment or len(names) <= segment + 1:
+        return [(task, None, 0, None)]
+    jobs = []
+    first = 0
+    while first < len(names) - 1:
+        if first + segment + 1 >= len(names):
+            frames = names[first:]
+            keep = len(frames) * 2
+        else:
+            frames = names[first:first + segment + 1]
+            keep = segment * 2
+        segment_dir = os.path.join(task.to_working_dir, SEGMENTS_DIR,
+                                   '%05d' % len(jobs))
+        os.makedirs(os.path.join(segment_dir, 'in'))
+        os.makedirs(os.path.join(segment_dir, 'out'))
+        for name in frames:
+            from_file = os.path.join(task.from_working_dir, name)
+            to_file = os.path.join(segment_dir, 'in', name)
+            try:
+                os.link(from_file, to_file)
+            except OSError:
+                shutil.copyfile(from_file, to_file)
+        jobs.append((task, segment_dir, first, keep))
+        first += segment
+    return jobs
 
-def merge(input_, crf=12):
+def _interpolate__stitch(task, segment_dir, first, keep):
+    out_dir = os.path.join(segment_dir, 'out')
+    names = sorted(list_frames(out_dir))
+    if len(names) < keep:
+        log.warning(f'segment "{segment_dir}" has only '
+                    f'{len(names)} of {keep} frames')
+    for i, name in enumerate(names[:keep]):
+        os.rename(os.path.join(out_dir, name),
+                  os.path.join(task.to_working_dir, '%08d%s' % (
+                  first * 2 + i + 1, os.path.splitext(name)[1])))
+    shutil.rmtree(segment_dir)
 
-    import ffprobe
+def _interpolate__finish(job, frames, pending, pack, returncode, stderr,
+                         elapsed):
+    task, segment_dir, first, keep = job
+    if task.to_working_dir not in pending:
+        return
+    if returncode:
+        del pending[task.to_working_dir]
+        return
+    record_timing(task, 'rife-ncnn-vulkan', frames, elapsed)
+    if segment_dir is not None:
+        _interpolate__stitch(task, segment_dir, first, keep)
+    pending[task.to_working_dir] -= 1
+    if not pending[task.to_working_dir]:
+        segments_dir = os.path.join(task.to_working_dir, SEGMENTS_DIR)
+        if os.path.isdir(segments_dir):
+            shutil.rmtree(segments_dir)
+        if pack:
+            pack_frames(task.to_working_dir)
+        mark_done(task)
+        remove_from_working_dir(task)
+
+def merge(input_, crf=12, resume=False, encodes=0, segment=0,
+          pipe=False):
+
+    import concurrent.futures
+    import functools
 
     markdown('## Mergence')
     input_dir = os.path.abspath(input_)
-    tasks = get_effective_dirs(input_dir, 6)
+    if resume:
+        _merge__remove_incomplete(input_dir)
+    tasks = [task for task in get_effective_dirs(input_dir, 6)
+             if not os.path.exists(task.dst_file)]
+    probes = get_probe_cache(input_dir).map([task.src for task in tasks])
     active_tasks = []
-    for idx, task in rich.progress.track(enumerate(tasks, start=1),
-                   total=len(tasks), description='Collecting ...'):
-        if os.path.exists(task.dst_file):
-            continue
-        metadata = ffprobe.FFProbe(task.src)
+    audio_jobs = []
+    for idx, (task, metadata) in rich.progress.track(
+        enumerate(zip(tasks, probes), start=1),
+        total=len(tasks), description='Collecting ...'
+    ):
         try:
             video0 = metadata.video[0]
         except IndexError:
@@ -603,25 +1561,37 @@ def merge(input_, crf=12):
                 log.warning(f'"{task.to_working_dir}" '
                             'exists but is not a directory')
                 continue
-            shutil.rmtree(task.to_working_dir)
-            log.warning(f'directory "{task.to_working_dir}" '
-                        'has been reset')
+            if not resume:
+                shutil.rmtree(task.to_working_dir)
+                log.warning(f'directory "{task.to_working_dir}" '
+                            'has been reset')
         clean_other_files(task.from_working_dir)
-        os.mkdir(task.to_working_dir)
-        for audio in enumerate(metadata.audio, start=1):
-            audio_m4a = os.path.join(task.to_working_dir, '%05d.m4a')
-            bit_rate = '%dk' % int(int(audio[1].bit_rate)/1000)
-            args = ['/usr/bin/ffmpeg', '-i', task.src, '-vn',
-                    '-c:a', 'aac', '-b:a', bit_rate, audio_m4a]
-            with subprocess.Popen(args,
-                 stdout=subprocess.DEVNULL,
-                 stderr=subprocess.DEVNULL) as proc:
-                proc.communicate()
+        if not pipe:
+            convert_frames(task.from_working_dir, FFMPEG_EXTS)
+        os.makedirs(task.to_working_dir, exist_ok=True)
+        for audio_idx, audio in enumerate(metadata.audio):
+            audio_m4a = os.path.join(task.to_working_dir,
+                                     '%05d.m4a' % (audio_idx + 1))
+            if resume and is_complete_video(audio_m4a):
+                continue
+            audio_jobs.append((task.src, audio_idx, audio, audio_m4a))
+    with concurrent.futures.ThreadPoolExecutor(audio__threads) as executor:
+        for _ in rich.progress.track(
+                 executor.map(_merge__extract_audio, audio_jobs),
+                 total=len(audio_jobs), description='Extracting audio ...'):
+            pass
+    logical_cores = psutil.cpu_count(logical=True)
+    if not encodes:
+        encodes = max(1, logical_cores // encode__threads_per_job)
+    x265_params = _merge__x265_params(max(1, logical_cores // encodes))
+    if segment:
+        segment = -(-segment // encode__keyint) * encode__keyint
+    supervisor = ProcessSupervisor({'libx265': encodes})
+    seconds_per_frame = get_manifest(input_dir).seconds_per_frame('libx265')
     regex_digital = re.compile(r'[0-9]{3,}')
-    for idx, (task, metadata) in rich.progress.track(
-        enumerate(active_tasks, start=1),
-        total=len(active_tasks), description='Merging ...'
-    ):
+    encode_jobs = []
+    pending = {}
+    for task, metadata in active_tasks:
         video0 = metadata.video[0]
         numerator, denominator = video0.avg_frame_rate.split('/')
         for name in os.listdir(task.dst_dir):
@@ -630,38 +1600,199 @@ def merge(input_, crf=12):
                 break
         else:
             tbr = str(float(numerator)/float(denominator))
-        for name in os.listdir(task.from_working_dir):
-            root, ext = os.path.splitext(name)
-            if ext not in ['.png', '.jpg', '.jpeg']:
-                continue
-            match = regex_digital.search(root)
-            if not match:
-                continue
-            parts = regex_digital.split(root)
-            if len(parts) != 2:
+        if pipe:
+            names = sorted(list_frames(task.from_working_dir))
+            if not names:
+                log.warning(f'no frames found in "{task.from_working_dir}"')
                 continue
-            fmt = f'%0{match.end()-match.start()}d'
-            fmt = f'{parts[0]}{fmt}{parts[1]}{ext}'
-            fmt = os.path.join(task.from_working_dir, fmt)
-            break
+            img = read_frame(os.path.join(task.from_working_dir, names[0]))
+            input_args = ['-f', 'rawvideo',
+                          '-pix_fmt', PIPE_PIX_FMTS[img.dtype.name],
+                          '-s', '%dx%d' % (img.shape[1], img.shape[0]),
+                          '-framerate', tbr, '-i', 'pipe:0']
         else:
-            log.warning('cannot detect frame format in '
-                        f'"{task.from_working_dir}"')
-        args = ['konsole', '-e',
-                '/usr/bin/ffmpeg', '-framerate', tbr, '-i', fmt]
-        for name in os.listdir(task.to_working_dir):
+            names = sorted(name for name in list_frames(task.from_working_dir)
+                           if os.path.splitext(name)[1].lower()
+                              in FFMPEG_EXTS)
+            for name in names:
+                root, ext = os.path.splitext(name)
+                match = regex_digital.search(root)
+                if not match:
+                    continue
+                parts = regex_digital.split(root)
+                if len(parts) != 2:
+                    continue
+                fmt = f'%0{match.end()-match.start()}d'
+                fmt = f'{parts[0]}{fmt}{parts[1]}{ext}'
+                fmt = os.path.join(task.from_working_dir, fmt)
+                break
+            else:
+                log.warning('cannot detect frame format in '
+                            f'"{task.from_working_dir}"')
+                continue
+            first_number = int(regex_digital.search(
+                               os.path.splitext(names[0])[0]).group())
+        audio_args = []
+        maps = ['-map', '0:v']
+        audio_files = sorted(name for name in os.listdir(task.to_working_dir)
+                             if name.endswith('.m4a'))
+        for i, name in enumerate(audio_files, start=1):
             audio_m4a = os.path.join(task.to_working_dir, name)
-            args.extend(['-i', audio_m4a])
-        args.extend(['-c:a', 'copy', '-crf', str(crf), '-c:v', 'libx265',
-                                   '-pix_fmt', 'yuv420p', task.dst_file])
-        with subprocess.Popen(args,
-             stdout=subprocess.DEVNULL,
-             stderr=subprocess.DEVNULL) as proc:
-            proc.communicate()
-        #shutil.rmtree(task.dst_dir)
-    summary(input_dir, 6)
-
-def main():
+            audio_args.extend(['-i', audio_m4a])
+            maps.extend(['-map', f'{i}:a'])
+        video_args = ['-crf', str(crf), '-c:v', 'libx265',
+                      '-x265-params', x265_params, '-pix_fmt', 'yuv420p']
+        jobs = _merge__segments(task, names, segment)
+        pending[task.dst_dir] = len(jobs)
+        for job in jobs:
+            task, segment_file, first, frames = job
+            args = ['/usr/bin/ffmpeg', '-nostdin', '-nostats',
+                    '-progress', 'pipe:1']
+            if pipe:
+                args.extend(input_args)
+                feed = functools.partial(_merge__feed, [
+                       os.path.join(task.from_working_dir, name)
+                       for name in names[first:first+frames]])
+            elif segment_file is None:
+                args.extend(['-framerate', tbr, '-i', fmt])
+                feed = None
+            else:
+                args.extend(['-framerate', tbr,
+                             '-start_number', str(first_number + first),
+                             '-i', fmt, '-frames:v', str(frames)])
+                feed = None
+            if segment_file is None:
+                args.extend(audio_args + maps + ['-c:a', 'copy']
+                            + video_args + [task.dst_file])
+            else:
+                args.extend(['-y'] + video_args + [segment_file])
+            encode_jobs.append((job, args, audio_args + maps, feed))
+    total = sum(job[3] for job, args, join_args, feed in encode_jobs)
+    with StageProgress('Merging ...', total) as progress:
+        for job, args, join_args, feed in encode_jobs:
+            task, segment_file, first, frames = job
+            supervisor.submit('libx265', args, task.dst_dir,
+                              functools.partial(_merge__finish, job,
+                                                pending, join_args),
+                              frames * seconds_per_frame,
+                              functools.partial(_merge__progress, progress,
+                                  os.path.basename(task.dst_dir), [0]),
+                              feed)
+        supervisor.run()
+    summary(input_dir, 6, supervisor.makespan)
+
+def _merge__x265_params(threads):
+    for cores, frame_threads in [(32, 6), (16, 5), (8, 3), (4, 2)]:
+        if threads >= cores:
+            break
+    else:
+        frame_threads = 1
+    return f'pools={threads}:frame-threads={frame_threads}:' \
+           f'keyint={encode__keyint}'
+
+def _merge__segments(task, names, segment):
+    segments_dir = os.path.join(task.to_working_dir, SEGMENTS_DIR)
+    if os.path.isdir(segments_dir):
+        shutil.rmtree(segments_dir)
+    if not segment or len(names) <= segment:
+        return [(task, None, 0, len(names))]
+    os.mkdir(segments_dir)
+    jobs = []
+    for first in range(0, len(names), segment):
+        segment_file = os.path.join(segments_dir, '%05d.mp4' % len(jobs))
+        jobs.append((task, segment_file, first,
+                     min(segment, len(names) - first)))
+    return jobs
+
+def _merge__feed(paths):
+
+    import concurrent.futures
+
+    with concurrent.futures.ThreadPoolExecutor(pipe__threads) as executor:
+        window = collections.deque()
+        for path in paths:
+            window.append(executor.submit(read_frame, path))
+            if len(window) >= pipe__prefetch_frames:
+                yield window.popleft().result().tobytes()
+        while window:
+            yield window.popleft().result().tobytes()
+
+def _merge__join(task, join_args):
+    segments_dir = os.path.join(task.to_working_dir, SEGMENTS_DIR)
+    concat_file = os.path.join(segments_dir, 'concat.txt')
+    with open(concat_file, 'w') as f:
+        for name in sorted(os.listdir(segments_dir)):
+            if name.endswith('.mp4'):
+                path = os.path.join(segments_dir, name).replace("'", "'\\''")
+                f.write(f"file '{path}'\n")
+    args = ['/usr/bin/ffmpeg', '-nostdin', '-v', 'error',
+            '-f', 'concat', '-safe', '0', '-i', concat_file] + join_args \
+         + ['-c', 'copy', task.dst_file]
+    proc = subprocess.run(args, stdout=subprocess.DEVNULL,
+                          stderr=subprocess.PIPE)
+    if proc.returncode:
+        log.warning(f'cannot join the segments of "{task.dst_file}": '
+                    + proc.stderr.decode(errors='replace').strip())
+        if os.path.exists(task.dst_file):
+            os.remove(task.dst_file)
+        return False
+    shutil.rmtree(segments_dir)
+    return True
+
+def _merge__progress(progress, worker, last, line):
+    key, _, value = line.partition('=')
+    if 'frame' == key and value.strip().isdigit():
+        frame = int(value)
+        progress.advance(frame - last[0], worker)
+        last[0] = frame
+
+def _merge__finish(job, pending, join_args, returncode, stderr, elapsed):
+    task, segment_file, first, frames = job
+    if task.dst_dir not in pending:
+        return
+    if returncode:
+        del pending[task.dst_dir]
+        if segment_file is None and os.path.exists(task.dst_file):
+            os.remove(task.dst_file)
+        return
+    record_timing(task, 'libx265', frames, elapsed)
+    pending[task.dst_dir] -= 1
+    if pending[task.dst_dir]:
+        return
+    if segment_file is not None and not _merge__join(task, join_args):
+        return
+    mark_done(task)
+    #shutil.rmtree(task.dst_dir)
+
+def _merge__extract_audio(job):
+    src, audio_idx, audio, audio_m4a = job
+    args = ['/usr/bin/ffmpeg', '-y', '-i', src,
+            '-map', f'0:a:{audio_idx}', '-vn']
+    if getattr(audio, 'codec_name', None) in AUDIO_COPY_CODECS:
+        args.extend(['-c:a', 'copy'])
+    else:
+        args.extend(['-c:a', 'aac'])
+        bit_rate = getattr(audio, 'bit_rate', '')
+        if bit_rate.isdigit():
+            args.extend(['-b:a', '%dk' % (int(bit_rate) // 1000)])
+    args.append(audio_m4a)
+    with subprocess.Popen(args,
+         stdout=subprocess.DEVNULL,
+         stderr=subprocess.DEVNULL) as proc:
+        proc.communicate()
+
+def _merge__remove_incomplete(input_dir):
+    manifest = get_manifest(input_dir)
+    for src, dst_dir in get_dst_dirs(input_dir):
+        root, ext = os.path.splitext(os.path.basename(src))
+        dst_file = os.path.join(input_dir, f'{root}-sugar{ext}')
+        if root.endswith('-sugar') or len(STEPS) in manifest.get(dst_dir):
+            continue
+        if os.path.exists(dst_file) and not is_complete_video(dst_file):
+            os.remove(dst_file)
+            log.warning(f'incomplete "{dst_file}" has been removed')
+
+def main():
 
     import argparse
 
@@ -694,13 +1825,15 @@ def main():
     group.add_argument(
             '-4',
             dest='deflickering',
-            help='step4 - Time-lapse Deflickering',
+            help='step4 - Time-lapse Deflickering, '
+                 '"builtin" for the built-in engine',
             metavar='/PATH/TO/BIN/timelapse-deflicker.pl'
     )
     group.add_argument(
             '-5',
             dest='interpolation',
-            help='step5 - Interpolation',
+            help='step5 - Interpolation, '
+                 '"builtin" for the built-in CPU engine',
          metavar='/PATH/TO/BIN/rife-ncnn-vulkan'
     )
     group.add_argument(
@@ -709,6 +1842,113 @@ def main():
             help='step6 - Mergence',
           action='store_true'
     )
+    group.add_argument(
+            '--reconcile',
+            dest='reconciliation',
+            help='rebuild the pipeline manifest from marker files',
+          action='store_true'
+    )
+    parser.add_argument(
+            '--frame-cache',
+            dest='frame_cache',
+            help='reuse graded frames from this cache directory',
+         metavar='DIRECTORY'
+    )
+    parser.add_argument(
+            '--frame-format',
+            dest='frame_format',
+            help='format of the intermediate frames (default: png)',
+         choices=sorted(FRAME_FORMATS),
+         default='png'
+    )
+    parser.add_argument(
+            '--png-compression',
+            dest='png_compression',
+            help='PNG compression level of the color graded frames, '
+                 '0-9 (default: %(default)s)',
+            type=int,
+         choices=range(10),
+         metavar='LEVEL',
+         default=frame__png_compression
+    )
+    parser.add_argument(
+            '--fuse-deflicker',
+            dest='fused_deflickering',
+            help='deflicker the frames while grading them and skip '
+                 'the LDR enhancement (step2)',
+          action='store_true'
+    )
+    parser.add_argument(
+            '--stream',
+            help='decode videos without stabilized frames with ffmpeg '
+                 'and grade them into a frame store (step2)',
+          action='store_true'
+    )
+    parser.add_argument(
+            '--rife-gpu',
+            dest='rife_gpu',
+            help='GPU ids passed to rife-ncnn-vulkan as -g '
+                 '(default: %(default)s)',
+         metavar='IDS',
+         default=rife_ncnn_vulkan__arg_g
+    )
+    parser.add_argument(
+            '--rife-threads',
+            dest='rife_threads',
+            help='thread counts passed to rife-ncnn-vulkan as -j '
+                 '(default: %(default)s)',
+         metavar='LOAD:PROC:SAVE',
+         default=rife_ncnn_vulkan__arg_j
+    )
+    parser.add_argument(
+            '--rife-instances',
+            dest='rife_instances',
+            help='number of rife-ncnn-vulkan processes run at once '
+                 '(default: %(default)s)',
+            type=int,
+         metavar='N',
+         default=rife_ncnn_vulkan__instances
+    )
+    parser.add_argument(
+            '--rife-segment',
+            dest='rife_segment',
+            help='split longer videos into overlapping segments of '
+                 'this many frames and interpolate them in parallel',
+            type=int,
+         metavar='FRAMES',
+         default=0
+    )
+    parser.add_argument(
+            '--encodes',
+            help='number of final encodes run at once, sharing the CPU '
+                 'threads between them (default: one per %d logical '
+                 'cores) (step6)' % encode__threads_per_job,
+            type=int,
+         metavar='N',
+         default=0
+    )
+    parser.add_argument(
+            '--encode-segment',
+            dest='encode_segment',
+            help='split longer videos into segments of this many frames '
+                 '(rounded up to a multiple of %d), encode them in '
+                 'parallel and join them (step6)' % encode__keyint,
+            type=int,
+         metavar='FRAMES',
+         default=0
+    )
+    parser.add_argument(
+            '--pipe',
+            help='feed the decoded frames to ffmpeg as raw video '
+                 'instead of letting it read the frame files (step6)',
+          action='store_true'
+    )
+    parser.add_argument(
+            '--resume',
+            help='keep the valid frames of an interrupted run '
+                 'instead of resetting its working directory',
+          action='store_true'
+    )
     opts = parser.parse_args()
     try:
         if opts.stabilization:
@@ -717,15 +1957,26 @@ def main():
             lut_files = []
             for lut_file in opts.LUTs.split('|'):
                 lut_files.append(lut_file.strip())
-            color_grade(opts.input_[0], lut_files)
+            color_grade(opts.input_[0], lut_files,
+                        opts.resume, opts.frame_cache,
+                        opts.frame_format, opts.png_compression,
+                        opts.stream, opts.fused_deflickering)
         if opts.ldr_enhancement:
-            ldr_enhance(opts.input_[0], opts.ldr_enhancement)
+            ldr_enhance(opts.input_[0], opts.ldr_enhancement,
+                        'store' == opts.frame_format)
         if opts.deflickering:
-            deflicker(opts.input_[0], opts.deflickering)
+            deflicker(opts.input_[0], opts.deflickering, opts.resume,
+                      'store' == opts.frame_format)
         if opts.interpolation:
-            interpolate(opts.input_[0], opts.interpolation)
+            interpolate(opts.input_[0], opts.interpolation, opts.resume,
+                        'store' == opts.frame_format, opts.rife_instances,
+                        opts.rife_segment, opts.rife_gpu, opts.rife_threads)
         if opts.mergence:
-            merge(opts.input_[0])
+            merge(opts.input_[0], resume=opts.resume,
+                  encodes=opts.encodes, segment=opts.encode_segment,
+                  pipe=opts.pipe)
+        if opts.reconciliation:
+            reconcile(opts.input_[0])
     except FileNotFoundError as e:
         log.error(e.strerror)
         raise
@@ -738,70 +1989,55 @@ def main():
         raise
         sys.exit(0)
 
-def summary(input_dir, step):
+def summary(input_dir, step, caption=None):
     assert 0 < step < len(STEPS) + 1
     markdown(f'## {STEPS[step-1]} Summary')
     tasks = get_effective_dirs(input_dir, step)
-    table = rich.table.Table(
+    manifest = get_manifest(input_dir)
+    table = rich.table.Table(caption=caption,
             show_header=True, header_style='bold magenta')
     table.add_column('Id', justify='right')
     table.add_column('Video')
     table.add_column('Frames', justify='right')
     table.add_column('Usage', justify='right')
     table.add_column('Stage')
-    for idx, (src, dst_dir) in enumerate(get_dst_dirs(input_dir),
-                                                        start=1):
+    dst_dirs = list(get_dst_dirs(input_dir))
+    directory_stats.map([os.path.join(dst_dir, WORKING_DIRS[step-1])
+                         for src, dst_dir in dst_dirs
+                         if step not in manifest.get(dst_dir)])
+    for idx, (src, dst_dir) in enumerate(dst_dirs, start=1):
         src_name = os.path.basename(src)
         src_dir = os.path.dirname(src)
         root, ext = os.path.splitext(src_name)
         if root.endswith('-sugar'):
             continue
         dst_file = os.path.join(src_dir, f'{root}-sugar{ext}')
+        steps = manifest.get(dst_dir)
         if os.path.exists(dst_file):
             last_completed_step = len(STEPS)
             stage = 'All done'
         else:
-            for step_i, done_file_name in reversed(list(
-                zip(range(len(STEPS)-1), DONE_FILES[:-1])
-            )):
-                if os.path.exists(os.path.join(dst_dir, done_file_name)):
-                    last_completed_step = step_i + 1
-                    stage = f'{STEPS[step_i]} ({last_completed_step})'
-                    break
+            last_completed_step = max([step_i for step_i in steps
+                                       if step_i < len(STEPS)], default=0)
+            if last_completed_step:
+                stage = f'{STEPS[last_completed_step-1]} ' \
+                        f'({last_completed_step})'
             else:
-                last_completed_step = 0
                 stage = '/'
             to_working_dir = os.path.join(dst_dir, WORKING_DIRS[step-1])
-            to_done_file = os.path.join(dst_dir, DONE_FILES[step-1])
-        if step == len(STEPS):
-            done_files = DONE_FILES[:-1] + [dst_file]
-        else:
-            done_files = DONE_FILES
-        broken = False
         if step < 2:
-            from_working_dir = None
-            from_done_file = None
+            from_step = None
+            broken = False
         else:
-            for working_dir_name, done_file_name in reversed(list(zip(
-                        WORKING_DIRS[:step-1], done_files[:step-1]))):
-                from_working_dir = os.path.join(
-                                   dst_dir, working_dir_name)
-                from_done_file = os.path.join(dst_dir, done_file_name)
-                if not os.path.exists(from_done_file):
-                    continue
-                if os.path.isdir(from_working_dir):
-                    if 0 == get_directory_contents([from_working_dir]):
-                        log.warning(f'The previous working directory '
-                                    f'"{from_working_dir}" is empty')
-                        continue
-                    break
-            else:
-                broken = True
-                from_working_dir = None
-                from_done_file = None
+            from_step = manifest.get_from_step(dst_dir, step)
+            broken = from_step is None
         if last_completed_step == len(STEPS):
             inodes, usage = get_directory_usage(dst_file)
             frames = 'N/A'
+        elif step in steps and steps[step]['frames'] is not None:
+            inodes = steps[step]['frames']
+            frames = str(inodes)
+            usage = format_size(steps[step]['usage'])
         elif os.path.isdir(to_working_dir):
             inodes, usage = get_directory_usage(to_working_dir)
             frames = str(inodes)
@@ -814,8 +2050,8 @@ def summary(input_dir, step):
         elif broken:
             stage = 'Broken'
             color = 'yellow'
-        elif from_working_dir is not None \
-             and get_directory_contents([from_working_dir]) != inodes:
+        elif from_step is not None \
+             and steps[from_step]['frames'] != inodes:
             color = 'red'
         else:
             color = None
@@ -826,8 +2062,9 @@ def summary(input_dir, step):
         table.add_row(str(idx), src_name, frames, usage, stage)
     rich.print(table)
 
-def get_effective_dirs(input_dir, step):
+def get_effective_dirs(input_dir, step, from_source=False):
     assert 0 < step < len(STEPS) + 1
+    manifest = get_manifest(input_dir)
     effective_dirs = []
     for src, dst_dir in get_dst_dirs(input_dir):
         src_name = os.path.basename(src)
@@ -839,55 +2076,192 @@ def get_effective_dirs(input_dir, step):
         if os.path.exists(dst_file):
             last_completed_step = len(STEPS)
         else:
-            for name in reversed(DONE_FILES):
-                if os.path.exists(os.path.join(dst_dir, name)):
-                    last_completed_step = DONE_FILES.index(name) + 1
-                    break
-            else:
-                last_completed_step = 0
+            last_completed_step = max(manifest.get(dst_dir), default=0)
         if last_completed_step >= step:
             continue
-        broken = False
         if step < 2:
             from_working_dir = None
-            from_done_file = None
         else:
-            for working_dir_name, done_file_name in reversed(list(zip(
-                        WORKING_DIRS[:step-1], DONE_FILES[:step-1]))):
+            from_step = manifest.get_from_step(dst_dir, step,
+                                               warn=not from_source)
+            if from_step is not None:
                 from_working_dir = os.path.join(
-                                   dst_dir, working_dir_name)
-                from_done_file = os.path.join(dst_dir, done_file_name)
-                if not os.path.exists(from_done_file):
-                    continue
-                if os.path.isdir(from_working_dir):
-                    if 0 == get_directory_contents([from_working_dir]):
-                        log.warning(f'The previous working directory '
-                                    f'"{from_working_dir}" is empty')
-                        continue
-                    break
+                                   dst_dir, WORKING_DIRS[from_step-1])
+            elif from_source:
+                from_working_dir = None
             else:
-                broken = True
-        if broken:
-            log.warning(f'The working directory {dst_dir} is broken')
-            continue
+                log.warning(f'The working directory {dst_dir} is broken')
+                continue
         to_working_dir = os.path.join(dst_dir, WORKING_DIRS[step-1])
         to_done_file = os.path.join(dst_dir, DONE_FILES[step-1])
-        if os.path.exists(to_done_file):
-            continue
-        if os.path.exists(to_working_dir):
-            if not os.path.isdir(to_working_dir):
-                log.warning(f'{to_working_dir} exists, '
-                            'but it must be a directory, ignored')
-                continue
         effective_dirs.append(Task(
            src, dst_file, dst_dir, from_working_dir,
            to_working_dir, to_done_file, last_completed_step))
     return effective_dirs
 
+def mark_done(task):
+    step = DONE_FILES.index(os.path.basename(task.to_done_file)) + 1
+    if step < len(STEPS):
+        with open(task.to_done_file, 'w'):
+            pass
+        output = task.to_working_dir
+    else:
+        output = task.dst_file
+    if os.path.isdir(output):
+        frames, usage = directory_stats.get(output)
+    elif os.path.exists(output):
+        frames, usage = None, directory_stats.get(output)[1]
+    else:
+        frames, usage = None, None
+    get_manifest(os.path.dirname(task.dst_dir)).record(
+        task.dst_dir, step, 'done', frames=frames, usage=usage)
+
+def record_timing(task, tool, frames, seconds):
+    step = DONE_FILES.index(os.path.basename(task.to_done_file)) + 1
+    get_manifest(os.path.dirname(task.dst_dir)).record(
+        task.dst_dir, step, 'timed', tool=tool, frames=frames,
+        seconds=seconds)
+
+def remove_from_working_dir(task):
+    release_frame_stores(task.from_working_dir)
+    if os.path.isdir(task.from_working_dir):
+        shutil.rmtree(task.from_working_dir)
+    step = WORKING_DIRS.index(os.path.basename(task.from_working_dir)) + 1
+    get_manifest(os.path.dirname(task.dst_dir)).record(
+        task.dst_dir, step, 'removed')
+
+def reconcile(input_):
+    markdown('## Manifest Reconciliation')
+    input_dir = os.path.abspath(input_)
+    manifest = get_manifest(input_dir)
+    manifest.reconcile()
+    markdown(f'The manifest `{manifest.path}` has been rebuilt '
+             f'for {len(manifest.videos)} videos.')
+
+def get_manifest(input_dir):
+    if input_dir not in _manifests:
+        _manifests[input_dir] = Manifest(input_dir)
+    return _manifests[input_dir]
+
+class Manifest:
+
+    def __init__(self, input_dir):
+        self.input_dir = input_dir
+        self.path = os.path.join(input_dir, MANIFEST_FILE)
+        self.videos = {}
+        self.timings = {}
+        if os.path.isfile(self.path):
+            self.load()
+        else:
+            self.reconcile()
+
+    def get(self, dst_dir):
+        return self.videos.get(os.path.basename(dst_dir), {})
+
+    def get_from_step(self, dst_dir, step, warn=False):
+        steps = self.get(dst_dir)
+        for from_step in range(step - 1, 0, -1):
+            if from_step not in steps:
+                continue
+            frames = steps[from_step]['frames']
+            if frames is None:
+                continue
+            if 0 == frames:
+                if warn:
+                    from_working_dir = os.path.join(
+                                       dst_dir, WORKING_DIRS[from_step-1])
+                    log.warning(f'The previous working directory '
+                                f'"{from_working_dir}" is empty')
+                continue
+            return from_step
+        return None
+
+    def seconds_per_frame(self, tool):
+        frames, seconds = self.timings.get(tool, (0, 0.))
+        if frames:
+            return seconds / frames
+        return supervisor__seconds_per_frame.get(tool, 1.)
+
+    def load(self):
+        self.videos = {}
+        self.timings = {}
+        with open(self.path) as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    log.warning(f'broken record in "{self.path}", ignored')
+                    continue
+                self._apply(record)
+
+    def record(self, dst_dir, step, event, **fields):
+        record = dict(video=os.path.basename(dst_dir), step=step,
+                      event=event, time=time.time(), **fields)
+        self._apply(record)
+        with open(self.path, 'a') as f:
+            f.write(json.dumps(record) + '\n')
+
+    def _apply(self, record):
+        if 'timed' == record['event']:
+            frames, seconds = self.timings.get(record['tool'], (0, 0.))
+            self.timings[record['tool']] = (frames + record['frames'],
+                                            seconds + record['seconds'])
+            return
+        steps = self.videos.setdefault(record['video'], {})
+        step = record['step']
+        if 'done' == record['event']:
+            steps[step] = {'frames': record.get('frames'),
+                           'usage': record.get('usage')}
+        elif 'removed' == record['event'] and step in steps:
+            steps[step]['frames'] = None
+            steps[step]['usage'] = None
+
+    def reconcile(self):
+        dst_dirs = list(get_dst_dirs(self.input_dir))
+        directory_stats.map([dst_dir for src, dst_dir in dst_dirs])
+        records = []
+        for src, dst_dir in dst_dirs:
+            root, ext = os.path.splitext(os.path.basename(src))
+            if root.endswith('-sugar'):
+                continue
+            for step in range(1, len(STEPS) + 1):
+                if step < len(STEPS):
+                    if not os.path.exists(os.path.join(
+                           dst_dir, DONE_FILES[step-1])):
+                        continue
+                    output = os.path.join(dst_dir, WORKING_DIRS[step-1])
+                else:
+                    output = os.path.join(os.path.dirname(src),
+                                          f'{root}-sugar{ext}')
+                    if not os.path.exists(output):
+                        continue
+                if os.path.isdir(output):
+                    frames, usage = directory_stats.get(output)
+                elif os.path.exists(output):
+                    frames, usage = None, directory_stats.get(output)[1]
+                else:
+                    frames, usage = None, None
+                records.append(dict(video=os.path.basename(dst_dir),
+                               step=step, event='done', time=time.time(),
+                               frames=frames, usage=usage))
+        for tool, (frames, seconds) in self.timings.items():
+            records.append(dict(video=None, step=None, event='timed',
+                                time=time.time(), tool=tool,
+                                frames=frames, seconds=seconds))
+        temp_file = self.path + '.tmp'
+        with open(temp_file, 'w') as f:
+            for record in records:
+                f.write(json.dumps(record) + '\n')
+        os.replace(temp_file, self.path)
+        self.videos = {}
+        self.timings = {}
+        for record in records:
+            self._apply(record)
+
 def clean_other_files(from_working_dir):
     for name in os.listdir(from_working_dir):
         root, ext = os.path.splitext(name)
-        if ext not in ['.png', '.jpg', '.jpeg']:
+        if ext.lower() not in FRAME_EXTS and FRAME_STORE_FILE != name:
             path = os.path.join(from_working_dir, name)
             if os.path.isdir(path):
                 shutil.rmtree(path)
@@ -911,51 +2285,829 @@ def get_dst_dirs(input_dir):
         yield src, dst_dir
 
 def get_directory_contents(dirs):
-    with subprocess.Popen(['du', '--max-depth=0', '--inodes'] + dirs,
-                    stdout=subprocess.PIPE,
-                    stderr=subprocess.DEVNULL) as proc:
-        outs = proc.communicate()[0]
-    contents = 0
-    for row in outs.split(b'\n'):
-        if row.strip():
-            contents += int(row.split(None, 1)[0]) - 1
-    return contents
-
-def get_que(buf, channels, min_, max_):
-    total = len(buf)
-    que = []
-    prev = max_ + 1
-    while buf:
-        chunk = min(max(int(len(buf) / channels), min_), max_)
-        if chunk == prev:
-            while buf:
-                items = []
-                for i in range(chunk):
-                    items.append(buf.popleft())
-                    if not buf:
-                        break
-                if items:
-                    que.append(items)
-            return total, que
-        while len(buf) >= chunk * channels:
-            for i in range(channels):
-                items = []
-                for j in range(chunk):
-                    items.append(buf.popleft())
-                que.append(items)
-        prev = chunk
-    return total, que
+    return sum(entries for entries, usage in directory_stats.map(dirs))
+
+class FrameScheduler:
+
+    def __init__(self, buf, channels, min_, max_, weight=None):
+        if weight is not None:
+            buf = sorted(buf, key=weight, reverse=True)
+        self.buf = collections.deque(buf)
+        self.channels = channels
+        self.min_ = min_
+        self.max_ = max_
+        self.latency = None
+
+    def __iter__(self):
+        while self.buf:
+            yield self.next_chunk()
+
+    def next_chunk(self, probe=False):
+        if probe:
+            chunk = self.min_
+        else:
+            chunk = int(len(self.buf) / (self.channels * 2))
+        if self.latency:
+            chunk = min(chunk, int(scheduler__chunk_seconds / self.latency))
+        chunk = min(max(chunk, self.min_), self.max_)
+        items = []
+        while self.buf and len(items) < chunk:
+            items.append(self.buf.popleft())
+        return items
+
+    def feed(self, frames, elapsed):
+        latency = elapsed / frames
+        if self.latency is None:
+            self.latency = latency
+        else:
+            self.latency += (latency - self.latency) * .3
+
+    def run(self, pool, func):
+
+        import queue
+
+        done = queue.Queue()
+        pending = 0
+        while True:
+            while self.buf and pending < self.channels * scheduler__depth:
+                items = self.next_chunk(probe=self.latency is None)
+                pool.apply_async(_call_timed, (func, items),
+                                 callback=done.put,
+                                 error_callback=done.put)
+                pending += 1
+            if not pending:
+                break
+            result = done.get()
+            pending -= 1
+            if isinstance(result, BaseException):
+                raise result
+            pid, frames, elapsed, value = result
+            if frames:
+                self.feed(frames, elapsed)
+            yield pid, frames, value
+
+def _call_timed(func, items):
+    start = time.perf_counter()
+    value = func(items)
+    return os.getpid(), len(items), time.perf_counter() - start, value
 
 def get_directory_usage(dir_):
-    with subprocess.Popen(['du', '--inodes', dir_],
-                   stdout=subprocess.PIPE) as proc:
-        outs = proc.communicate()[0]
-    inodes = int(outs.split(None, 1)[0]) - 1
-    with subprocess.Popen(['du', '--max-depth=0', '-h', dir_],
-                              stdout=subprocess.PIPE) as proc:
-        outs = proc.communicate()[0]
-    usage = outs.split(None, 1)[0].decode()
-    return inodes, usage
+    entries, usage = directory_stats.get(dir_)
+    return entries, format_size(usage)
+
+class DirectoryStats:
+
+    def __init__(self):
+        self.cache = {}
+
+    def get(self, path):
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            return 0, 0
+        usage = st.st_blocks * 512
+        if not os.path.isdir(path):
+            return 0, usage
+        key = (st.st_ino, st.st_mtime_ns)
+        cached = self.cache.get(path)
+        if cached is not None and cached[0] == key:
+            entries, files_usage, subdirs, store = cached[1:]
+        else:
+            scanned = time.time()
+            entries = 0
+            files_usage = 0
+            subdirs = []
+            store = False
+            with os.scandir(path) as it:
+                for entry in it:
+                    if FRAME_STORE_FILE == entry.name:
+                        store = True
+                        continue
+                    entries += 1
+                    if entry.is_dir(follow_symlinks=False):
+                        subdirs.append(entry.path)
+                    else:
+                        files_usage += entry.stat(
+                                 follow_symlinks=False).st_blocks * 512
+            if scanned - st.st_mtime > directory_stats__settle_seconds:
+                self.cache[path] = (key, entries, files_usage,
+                                    subdirs, store)
+        usage += files_usage
+        if store:
+            try:
+                entries += get_frame_store(path).count()
+                usage += os.stat(os.path.join(
+                         path, FRAME_STORE_FILE)).st_blocks * 512
+            except (OSError, ValueError):
+                pass
+        for subdir in subdirs:
+            subdir_entries, subdir_usage = self.get(subdir)
+            entries += subdir_entries
+            usage += subdir_usage
+        return entries, usage
+
+    def map(self, paths):
+
+        import concurrent.futures
+
+        if len(paths) < 2:
+            return [self.get(path) for path in paths]
+        with concurrent.futures.ThreadPoolExecutor(
+             directory_stats__threads) as executor:
+            return list(executor.map(self.get, paths))
+
+def get_probe_cache(input_dir):
+    if input_dir not in _probe_caches:
+        _probe_caches[input_dir] = ProbeCache(input_dir)
+    return _probe_caches[input_dir]
+
+class ProbeCache:
+
+    def __init__(self, input_dir):
+        self.input_dir = input_dir
+        self.path = os.path.join(input_dir, PROBE_CACHE_FILE)
+        self.entries = {}
+        if os.path.isfile(self.path):
+            try:
+                with open(self.path) as f:
+                    self.entries = json.load(f)
+            except ValueError:
+                log.warning(f'broken "{self.path}", ignored')
+
+    def get(self, path):
+        return self.map([path])[0]
+
+    def map(self, paths):
+
+        import concurrent.futures
+
+        with concurrent.futures.ThreadPoolExecutor(
+             probe__threads) as executor:
+            results = list(executor.map(self._probe, paths))
+        if any(probed for probed, probe in results):
+            self.save()
+        return [probe for probed, probe in results]
+
+    def save(self):
+        temp_file = self.path + '.tmp'
+        with open(temp_file, 'w') as f:
+            json.dump(self.entries, f)
+        os.replace(temp_file, self.path)
+
+    def _probe(self, path):
+
+        import ffprobe
+
+        key = os.path.relpath(path, self.input_dir)
+        st = os.stat(path)
+        entry = self.entries.get(key)
+        probed = entry is None or entry['size'] != st.st_size \
+                 or entry['mtime'] != st.st_mtime_ns
+        if probed:
+            streams = []
+            for stream in ffprobe.FFProbe(path).streams:
+                streams.append({name: value for name, value
+                                in vars(stream).items()
+                                if isinstance(value, (str, int, float))})
+            entry = dict(size=st.st_size, mtime=st.st_mtime_ns,
+                         streams=streams)
+            self.entries[key] = entry
+        return probed, Probe(entry['streams'])
+
+class Probe:
+
+    def __init__(self, streams):
+
+        import types
+
+        self.streams = [types.SimpleNamespace(**stream)
+                        for stream in streams]
+        self.video = [stream for stream in self.streams
+                      if 'video' == getattr(stream, 'codec_type', None)]
+        self.audio = [stream for stream in self.streams
+                      if 'audio' == getattr(stream, 'codec_type', None)]
+
+def format_size(size):
+    if size < 1024:
+        return str(size)
+    for unit in 'KMGTPE':
+        size /= 1024
+        if size < 10:
+            return '%.1f%s' % (math.ceil(size * 10) / 10, unit)
+        if size < 1024 or 'E' == unit:
+            return '%d%s' % (math.ceil(size), unit)
+
+def format_duration(seconds):
+    seconds = round(seconds)
+    return '%d:%02d:%02d' % (seconds // 3600, seconds // 60 % 60,
+                             seconds % 60)
+
+class StageProgress:
+
+    def __init__(self, description, total):
+        self.progress = rich.progress.Progress(
+            rich.progress.TextColumn('{task.description}'),
+            rich.progress.BarColumn(),
+            rich.progress.MofNCompleteColumn(),
+            _FpsColumn(),
+            rich.progress.TimeRemainingColumn(),
+        )
+        self.stage = self.progress.add_task(description, total=total)
+        self.workers = {}
+        self.last_seen = {}
+
+    def __enter__(self):
+        self.progress.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.progress.stop()
+
+    @property
+    def finished(self):
+        return self.progress.tasks[self.stage].finished
+
+    def advance(self, frames, worker=None):
+        if not frames:
+            return
+        self.progress.advance(self.stage, frames)
+        now = time.monotonic()
+        if worker is not None:
+            if worker not in self.workers:
+                self.workers[worker] = self.progress.add_task(
+                                       f'  {worker}', total=None)
+            self.progress.update(self.workers[worker],
+                                 advance=frames, visible=True)
+            self.last_seen[worker] = now
+        for worker, last_seen in self.last_seen.items():
+            if now - last_seen > progress__idle_seconds:
+                self.progress.update(self.workers[worker], visible=False)
+
+class _FpsColumn(rich.progress.ProgressColumn):
+
+    def render(self, task):
+        if task.speed is None:
+            return rich.text.Text('-- fps', style='progress.data.speed')
+        return rich.text.Text(f'{task.speed:.1f} fps',
+                              style='progress.data.speed')
+
+class DirectoryWatcher:
+
+    IN_CLOSE_WRITE = 0x00000008
+    IN_MOVED_TO = 0x00000080
+    IN_Q_OVERFLOW = 0x00004000
+    IN_NONBLOCK = 0o4000
+    IN_CLOEXEC = 0o2000000
+
+    def __init__(self, dirs):
+        self.fd = None
+        self.wds = {}
+        try:
+            self._init_inotify(dirs)
+        except (AttributeError, OSError) as e:
+            log.warning(f'inotify is unavailable ({e}), '
+                        'falling back to directory scans')
+            self.close()
+        self.names = {dir_: set(list_frames(dir_)) for dir_ in dirs}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _init_inotify(self, dirs):
+
+        import ctypes
+        import ctypes.util
+
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        self.fd = libc.inotify_init1(self.IN_NONBLOCK | self.IN_CLOEXEC)
+        if self.fd < 0:
+            self.fd = None
+            raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+        for dir_ in dirs:
+            wd = libc.inotify_add_watch(self.fd, os.fsencode(dir_),
+                                self.IN_CLOSE_WRITE | self.IN_MOVED_TO)
+            if wd < 0:
+                raise OSError(ctypes.get_errno(),
+                              f'cannot watch "{dir_}"')
+            self.wds[wd] = dir_
+
+    def close(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+    def wait(self, timeout):
+
+        import select
+        import struct
+
+        deltas = collections.Counter()
+        if self.fd is None:
+            time.sleep(timeout)
+            return self.rescan()
+        if not select.select([self.fd], [], [], timeout)[0]:
+            return deltas
+        try:
+            data = os.read(self.fd, 1 << 16)
+        except BlockingIOError:
+            return deltas
+        offset = 0
+        while offset < len(data):
+            wd, mask, cookie, length = struct.unpack_from('iIII',
+                                                          data, offset)
+            offset += 16
+            name = data[offset:offset+length].rstrip(b'\0')
+            offset += length
+            if mask & self.IN_Q_OVERFLOW:
+                deltas.update(self.rescan())
+                continue
+            dir_ = self.wds.get(wd)
+            if dir_ is None:
+                continue
+            name = os.fsdecode(name)
+            if is_frame(name) and name not in self.names[dir_]:
+                self.names[dir_].add(name)
+                deltas[dir_] += 1
+        return deltas
+
+    def rescan(self):
+        deltas = collections.Counter()
+        for dir_, names in self.names.items():
+            if not os.path.isdir(dir_):
+                continue
+            for name in list_frames(dir_):
+                if name not in names:
+                    names.add(name)
+                    deltas[dir_] += 1
+        return deltas
+
+class ProcessSupervisor:
+
+    def __init__(self, limits):
+        self.limits = limits
+        self.jobs = []
+        self.predicted = self.elapsed = 0.
+
+    def submit(self, tool, args, cwd=None, on_exit=None, cost=0.,
+               on_stdout=None, feed=None):
+        self.jobs.append((tool, args, cwd, on_exit, cost, on_stdout, feed))
+
+    def run(self, watch=None):
+
+        import asyncio
+
+        self.jobs.sort(key=lambda job: -job[4])
+        self.predicted = self.predict(self.jobs)
+        start = time.monotonic()
+        results = asyncio.run(self._run(watch))
+        self.elapsed = time.monotonic() - start
+        return results
+
+    def predict(self, jobs):
+
+        import heapq
+
+        makespan = 0.
+        for tool, limit in self.limits.items():
+            slots = [0.] * limit
+            for job in jobs:
+                if tool == job[0]:
+                    heapq.heapreplace(slots, slots[0] + job[4])
+            makespan = max([makespan] + slots)
+        return makespan
+
+    @property
+    def makespan(self):
+        return f'makespan {format_duration(self.elapsed)} ' \
+               f'(predicted {format_duration(self.predicted)})'
+
+    async def _run(self, watch):
+
+        import asyncio
+
+        loop = asyncio.get_running_loop()
+        semaphores = {tool: asyncio.Semaphore(limit)
+                      for tool, limit in self.limits.items()}
+        lock = asyncio.Lock()
+        jobs, self.jobs = self.jobs, []
+        runner = asyncio.ensure_future(asyncio.gather(
+                 *[self._run_job(semaphores[job[0]], lock, *job)
+                   for job in jobs]))
+        while watch is not None and not runner.done():
+            await asyncio.wait([runner, loop.run_in_executor(None, watch)],
+                               return_when=asyncio.FIRST_COMPLETED)
+        return await runner
+
+    async def _run_job(self, semaphore, lock, tool, args, cwd, on_exit,
+                       cost, on_stdout, feed):
+
+        import asyncio
+        import shlex
+
+        async with semaphore:
+            start = time.monotonic()
+            proc = await asyncio.create_subprocess_exec(*args, cwd=cwd,
+                   stdin=None if feed is None else subprocess.PIPE,
+                   stdout=subprocess.DEVNULL if on_stdout is None
+                          else subprocess.PIPE, stderr=subprocess.PIPE)
+            stderr, _, _ = await asyncio.gather(
+                           self._read_stderr(proc.stderr),
+                           self._read_stdout(proc.stdout, on_stdout),
+                           self._write_stdin(proc, tool, feed))
+            returncode = await proc.wait()
+            elapsed = time.monotonic() - start
+        if returncode:
+            log.warning(f'"{tool}" exited with status {returncode}: '
+                        f'{shlex.join(args)}'
+                        + ''.join(f'\n    {line}' for line in stderr))
+        if on_exit is not None:
+            async with lock:
+                await asyncio.to_thread(on_exit, returncode, stderr,
+                                        elapsed)
+        return returncode
+
+    async def _read_stderr(self, stream):
+        tail = b''
+        while chunk := await stream.read(supervisor__stderr_bytes):
+            tail = (tail + chunk)[-supervisor__stderr_bytes:]
+        stderr = tail.decode(errors='replace').splitlines()
+        return stderr[-supervisor__stderr_lines:]
+
+    async def _read_stdout(self, stream, on_stdout):
+        if stream is None:
+            return
+        while line := await stream.readline():
+            on_stdout(line.decode(errors='replace').rstrip())
+
+    async def _write_stdin(self, proc, tool, feed):
+
+        import asyncio
+
+        if feed is None:
+            return
+        chunks = feed()
+        try:
+            while (data := await asyncio.to_thread(
+                           next, chunks, None)) is not None:
+                proc.stdin.write(data)
+                await proc.stdin.drain()
+            proc.stdin.close()
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        except Exception as e:
+            log.warning(f'cannot feed "{tool}": {e}')
+            proc.kill()
+        finally:
+            await asyncio.to_thread(chunks.close)
+
+def read_frame(path):
+
+    import cv2
+    import numpy
+
+    ext = os.path.splitext(path)[1].lower()
+    if not ext:
+        return get_frame_store(os.path.dirname(path)).get(
+                               os.path.basename(path))
+    if '.npy' == ext:
+        return numpy.load(path, mmap_mode='r')
+    return cv2.imread(path, cv2.IMREAD_ANYDEPTH | cv2.IMREAD_COLOR)
+
+def decode_frame(data, ext):
+
+    import cv2
+    import io
+    import numpy
+
+    if '.npy' == ext.lower():
+        return numpy.load(io.BytesIO(data.tobytes()))
+    return cv2.imdecode(data, cv2.IMREAD_ANYDEPTH | cv2.IMREAD_COLOR)
+
+def write_frame(path, img, png_compression=None):
+
+    import cv2
+    import numpy
+
+    ext = os.path.splitext(path)[1].lower()
+    if not ext:
+        get_frame_store(os.path.dirname(path), 'r+').put(
+                        os.path.basename(path), img)
+        return
+    if '.npy' == ext:
+        with open(path, 'wb') as f:
+            numpy.save(f, img, allow_pickle=False)
+        return
+    if '.png' == ext:
+        if png_compression is None:
+            png_compression = frame__png_compression
+        params = [cv2.IMWRITE_PNG_COMPRESSION, png_compression]
+    elif ext in ['.tif', '.tiff']:
+        params = [cv2.IMWRITE_TIFF_COMPRESSION, 1]
+    else:
+        params = []
+    cv2.imwrite(path, img, params)
+
+def read_exactly(f, buf):
+    size = 0
+    while size < len(buf):
+        n = f.readinto(buf[size:])
+        if not n:
+            break
+        size += n
+    return size
+
+def convert_frames(dir_, exts):
+
+    import concurrent.futures
+
+    unpack_frames(dir_)
+    paths = [os.path.join(dir_, name) for name in list_frames(dir_)
+             if os.path.splitext(name)[1].lower() not in exts]
+    if not paths:
+        return
+    with concurrent.futures.ThreadPoolExecutor(
+         psutil.cpu_count(logical=True)) as executor:
+        list(executor.map(_convert_frame, paths))
+
+def _convert_frame(path):
+    img = read_frame(path)
+    write_frame(os.path.splitext(path)[0] + '.png', img)
+    os.remove(path)
+
+def get_frame_size(path):
+    if not os.path.splitext(path)[1]:
+        return get_frame_store(os.path.dirname(path)).stride
+    return os.path.getsize(path)
+
+def get_frame_store(dir_, mode='r'):
+    path = os.path.join(dir_, FRAME_STORE_FILE)
+    key = (path, os.stat(path).st_ino, mode)
+    if key not in _frame_stores:
+        _frame_stores[key] = FrameStore(path, mode)
+    return _frame_stores[key]
+
+def release_frame_stores(dir_):
+    prefix = os.path.join(dir_, '')
+    for key in [key for key in _frame_stores if key[0].startswith(prefix)]:
+        _frame_stores.pop(key).close()
+
+class FrameStore:
+
+    MAGIC = b'SUGARFS1'
+    ALIGNMENT = 4096
+
+    def __init__(self, path, mode='r'):
+
+        import numpy
+        import struct
+
+        self.path = path
+        with open(path, 'rb') as f:
+            if f.read(len(self.MAGIC)) != self.MAGIC:
+                raise ValueError(f'"{path}" is not a frame store')
+            length, = struct.unpack('<Q', f.read(8))
+            header = json.loads(f.read(length))
+        self.names = header['names']
+        self.index = {name: i for i, name in enumerate(self.names)}
+        self.shape = tuple(header['shape'])
+        self.dtype = numpy.dtype(header['dtype'])
+        self.stride = math.prod(self.shape) * self.dtype.itemsize
+        flags_offset = self._align(len(self.MAGIC) + 8 + length)
+        frames_offset = self._align(flags_offset + len(self.names))
+        self.flags = numpy.memmap(path, numpy.uint8, mode,
+                                  flags_offset, (len(self.names),))
+        self.frames = numpy.memmap(path, self.dtype, mode, frames_offset,
+                                   (len(self.names),) + self.shape)
+
+    def close(self):
+        del self.frames
+        del self.flags
+
+    @classmethod
+    def create(cls, path, names, shape, dtype):
+
+        import numpy
+        import struct
+
+        header = json.dumps(dict(names=list(names), shape=list(shape),
+                            dtype=numpy.dtype(dtype).str)).encode()
+        flags_offset = cls._align(len(cls.MAGIC) + 8 + len(header))
+        frames_offset = cls._align(flags_offset + len(names))
+        stride = math.prod(shape) * numpy.dtype(dtype).itemsize
+        temp_file = f'{path}.{os.getpid()}.tmp'
+        with open(temp_file, 'wb') as f:
+            f.write(cls.MAGIC)
+            f.write(struct.pack('<Q', len(header)))
+            f.write(header)
+            f.truncate(frames_offset + stride * len(names))
+        release_frame_stores(os.path.dirname(path))
+        os.replace(temp_file, path)
+        return cls(path, 'r+')
+
+    @classmethod
+    def _align(cls, offset):
+        return -(-offset // cls.ALIGNMENT) * cls.ALIGNMENT
+
+    def count(self):
+        return int(self.flags.sum())
+
+    def stored_names(self):
+        return [name for name, flag in zip(self.names, self.flags) if flag]
+
+    def get(self, name):
+        i = self.index[name]
+        if not self.flags[i]:
+            raise KeyError(f'frame "{name}" is not in "{self.path}"')
+        return self.frames[i]
+
+    def slot(self, name):
+        return self.frames[self.index[name]]
+
+    def put(self, name, img):
+
+        import numpy
+
+        if img.shape != self.shape or img.dtype != self.dtype:
+            raise ValueError(f'frame "{name}" is {img.dtype}{img.shape}, '
+                             f'{self.dtype}{self.shape} expected '
+                             f'by "{self.path}"')
+        i = self.index[name]
+        if not numpy.may_share_memory(self.frames[i], img):
+            self.frames[i] = img
+        self.flags[i] = 1
+
+def prepare_frame_store(dir_, names, shape, dtype, keep=False):
+
+    import numpy
+
+    if keep:
+        try:
+            store = get_frame_store(dir_)
+            if store.names == list(names) and store.shape == tuple(shape) \
+               and store.dtype == numpy.dtype(dtype):
+                return True
+        except (OSError, ValueError):
+            pass
+    FrameStore.create(os.path.join(dir_, FRAME_STORE_FILE),
+                      names, shape, dtype)
+    return False
+
+def pack_frames(dir_):
+
+    import concurrent.futures
+    import functools
+
+    store_file = os.path.join(dir_, FRAME_STORE_FILE)
+    names = sorted(list_frames(dir_))
+    if not names or os.path.exists(store_file):
+        return
+    img = read_frame(os.path.join(dir_, names[0]))
+    roots = [os.path.splitext(name)[0] for name in names]
+    store = FrameStore.create(store_file, roots, img.shape, img.dtype)
+    error = None
+    with concurrent.futures.ThreadPoolExecutor(
+         psutil.cpu_count(logical=True)) as executor:
+        try:
+            list(executor.map(functools.partial(_pack_frame, store, dir_),
+                              names))
+        except ValueError as e:
+            error = e
+    store.close()
+    if error is not None:
+        release_frame_stores(dir_)
+        os.remove(store_file)
+        log.warning(f'cannot pack "{dir_}": {error}')
+        return
+    for name in names:
+        os.remove(os.path.join(dir_, name))
+
+def _pack_frame(store, dir_, name):
+    store.put(os.path.splitext(name)[0], read_frame(os.path.join(dir_, name)))
+
+def unpack_frames(dir_):
+
+    import concurrent.futures
+    import functools
+
+    store_file = os.path.join(dir_, FRAME_STORE_FILE)
+    if not os.path.isfile(store_file):
+        return
+    store = get_frame_store(dir_)
+    with concurrent.futures.ThreadPoolExecutor(
+         psutil.cpu_count(logical=True)) as executor:
+        list(executor.map(functools.partial(_unpack_frame, store, dir_),
+                          store.stored_names()))
+    release_frame_stores(dir_)
+    os.remove(store_file)
+
+def _unpack_frame(store, dir_, name):
+    write_frame(os.path.join(dir_, name + '.png'), store.get(name))
+
+def scan_complete_frames(dir_):
+
+    import concurrent.futures
+
+    names = list_frames(dir_)
+    with concurrent.futures.ThreadPoolExecutor(
+         resume__threads) as executor:
+        flags = list(executor.map(is_complete_frame,
+                     [os.path.join(dir_, name) for name in names]))
+    complete = set()
+    for name, flag in zip(names, flags):
+        if flag:
+            complete.add(name)
+        else:
+            os.remove(os.path.join(dir_, name))
+    if len(complete) < len(names):
+        log.warning(f'{len(names) - len(complete)} truncated frames '
+                    f'in "{dir_}" have been removed')
+    return complete
+
+def is_complete_frame(path):
+    ext = os.path.splitext(path)[1].lower()
+    if not ext:
+        return True
+    try:
+        with open(path, 'rb') as f:
+            head = f.read(8)
+            size = f.seek(0, os.SEEK_END)
+            if '.png' == ext:
+                if head != PNG_SIGNATURE or size < 20:
+                    return False
+                f.seek(-12, os.SEEK_END)
+                return f.read(12) == PNG_IEND
+            if ext in ['.jpg', '.jpeg']:
+                if not head.startswith(b'\xff\xd8') or size < 4:
+                    return False
+                f.seek(-2, os.SEEK_END)
+                return f.read(2) == b'\xff\xd9'
+            if '.npy' == ext:
+                return _is_complete_npy(f, size)
+            return size > 0
+    except OSError:
+        return False
+
+def _is_complete_npy(f, size):
+
+    import numpy
+
+    f.seek(0)
+    try:
+        version = numpy.lib.format.read_magic(f)
+        if (1, 0) == version:
+            shape, fortran_order, dtype = \
+                   numpy.lib.format.read_array_header_1_0(f)
+        else:
+            shape, fortran_order, dtype = \
+                   numpy.lib.format.read_array_header_2_0(f)
+    except ValueError:
+        return False
+    return size == f.tell() + math.prod(shape) * dtype.itemsize
+
+def is_complete_video(path):
+
+    import struct
+
+    try:
+        with open(path, 'rb') as f:
+            size = f.seek(0, os.SEEK_END)
+            offset = 0
+            boxes = set()
+            while offset < size:
+                f.seek(offset)
+                header = f.read(16)
+                if len(header) < 8:
+                    return False
+                box_size, box_type = struct.unpack('>I4s', header[:8])
+                if 1 == box_size:
+                    if len(header) < 16:
+                        return False
+                    box_size = struct.unpack('>Q', header[8:])[0]
+                elif 0 == box_size:
+                    box_size = size - offset
+                if box_size < 8:
+                    return False
+                boxes.add(box_type)
+                offset += box_size
+            return offset == size and b'moov' in boxes
+    except OSError:
+        return False
+
+def list_frames(dir_):
+    names = []
+    with os.scandir(dir_) as it:
+        for entry in it:
+            if is_frame(entry.name):
+                names.append(entry.name)
+            elif FRAME_STORE_FILE == entry.name:
+                names.extend(get_frame_store(dir_).stored_names())
+    return names
+
+def is_frame(name):
+    return os.path.splitext(name)[1].lower() in FRAME_EXTS
 
 def markdown(*args, **kwargs):
     rich.print(rich.markdown.Markdown(*args, **kwargs))
@@ -977,6 +3129,12 @@ def get_logger():
     )
     return logging.getLogger('render')
 
+def get_command(path):
+    with open(path, 'rb') as f:
+        if b'\x7fELF' == f.read(4):
+            return [ld_linux, path]
+    return [path]
+
 def get_ld_linux():
     with subprocess.Popen(['/usr/bin/ldd', sys.executable],
                            stdout=subprocess.PIPE) as proc:
@@ -990,11 +3148,34 @@ WORKING_DIRS = '''stabilized color_graded enhanced deflickered \
 interpolated mergence_resources'''.split()
 DONE_FILES = '''stabilization_done color_gradation_done \
 enhancement_done deflickering_done interpolation_done all_done'''.split()
+MANIFEST_FILE = '.sugar_manifest.jsonl'
+PROBE_CACHE_FILE = '.sugar_probe.json'
+SEGMENTS_DIR = '.segments'
+FRAME_STORE_FILE = 'frames.sugar_store'
+FRAME_FORMATS = {'png': '.png', 'tiff': '.tif', 'npy': '.npy', 'store': ''}
+FRAME_EXTS = ['.png', '.jpg', '.jpeg', '.tif', '.tiff', '.npy']
+EASYHDR_EXTS = ['.png', '.jpg', '.jpeg', '.tif', '.tiff']
+DEFLICKER_EXTS = ['.png', '.jpg', '.jpeg', '.tif', '.tiff']
+RIFE_EXTS = ['.png', '.jpg', '.jpeg']
+FFMPEG_EXTS = ['.png', '.jpg', '.jpeg', '.tif', '.tiff']
+VIDEO_EXTS = ['.mp4', '.mov', '.mkv']
+AUDIO_COPY_CODECS = ['aac', 'alac', 'ac3', 'eac3']
+PIPE_PIX_FMTS = {'uint8': 'bgr24', 'uint16': 'bgr48le'}
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+PNG_IEND = b'\x00\x00\x00\x00IEND\xaeB`\x82'
 Task = collections.namedtuple('Task', '''\
 src dst_file dst_dir from_working_dir to_working_dir to_done_file \
 last_completed_step'''.split())
 ld_linux = get_ld_linux()
 log = get_logger()
+directory_stats = DirectoryStats()
+_manifests = {}
+_probe_caches = {}
+_frame_stores = {}
+_color_gradation = None
+_dis = None
+_lut_cache = collections.OrderedDict()
+_lut_cache_stats = collections.Counter()
 
 if '__main__' == __name__:
     main()
\ No newline at end of file